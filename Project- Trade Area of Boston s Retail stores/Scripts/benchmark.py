@@ -0,0 +1,477 @@
+'''----------------------------------------------------------------------------------
+ Source Name: benchmark.py
+ Description: Benchmark and regression harness for the NUMPY engine of GravityModel, Gravity and
+              WeightedCentralityScore. Synthetic origins and destinations are drawn around the
+              Boston coffee shops of the outreach project at increasing sizes (1k to 1M pairs by
+              default). Every stage of each tool is timed (best of the repeats) and traced for peak
+              memory, and the outputs are checked against a row at a time reference that follows
+              the geoprocessing workflow of the script tools. Stages run in worker processes have
+              no peak: their memory is in the workers and the shared memory blocks.
+
+              Besides the full matrix paths, the checks cover the neighbor limited paths (k nearest
+              and radius near tables, sparse interaction, neighbor sums) against brute force sorted
+              distances, the geodesic distances against Vincenty's formula on a sample of pairs,
+              and the distcache round trip of matrices and near tables.
+
+              The report is JSON. Given the report of an earlier run as a baseline, stages that
+              got slower by more than the allowed factor are listed as regressions, and the exit
+              code is 1 when there is a regression or a failed check.
+
+ Usage:       python benchmark.py [--sizes 1000 10000 ...] [--report report.json]
+                                  [--baseline old.json] [--slowdown 1.25]
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import distcache
+import geodesic
+import neighbors
+import parallel
+import shapefile
+import tradearea
+
+# Destinations and origins are drawn around these shops
+SEED_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Project- Boston Community Outreach Coffee Program.", "BostonCoffeeShops.shp")
+SIZES = [1000, 10000, 100000, 1000000]
+TOOLS = ["GravityModel", "Gravity", "WeightedCentralityScore"]
+
+# Relative and absolute tolerance of the reference checks
+RTOL = 1e-9
+ATOL = 1e-12
+
+# Relative tolerance of GEODESIC (Lambert) against Vincenty, and the pairs checked per size
+GEODESIC_RTOL = 1e-5
+GEODESIC_SAMPLE = 2000
+
+# Neighbor limited runs: nearest neighbors per feature, and the search radius in meters
+NEIGHBORS = 8
+RADIUS = 500.0
+
+# Synthetic points in meters are placed around this longitude/latitude for the geodesic checks
+CENTER = (-71.06, 42.36)
+
+# Slowdowns smaller than this many seconds are timer noise, not regressions
+NOISE = 0.001
+
+
+def SeedPoints(path=SEED_DATA):
+    # Shop locations in meters around Boston. Geocoding outliers far from the median are dropped;
+    # a random cloud over the city stands in when the data is not there
+    try:
+        lonlat = shapefile.ReadCentroids(path)
+    except OSError:
+        rng = np.random.default_rng(0)
+        lonlat = np.column_stack([rng.uniform(-71.19, -70.99, 250), rng.uniform(42.23, 42.40, 250)])
+    lonlat = lonlat[np.isfinite(lonlat).all(axis=1)]
+    lonlat = lonlat[(np.abs(lonlat - np.median(lonlat, axis=0)) < 0.5).all(axis=1)]
+    xy, _ = geodesic.LocalProjection(lonlat)
+    return xy - xy.mean(axis=0)
+
+
+def Synthetic(seed_xy, count, spread, rng):
+    # count points scattered around randomly chosen seed points, and lognormal attractiveness
+    xy = seed_xy[rng.integers(len(seed_xy), size=count)] + rng.normal(0, spread, (count, 2))
+    return xy, np.round(rng.lognormal(3, 1, count), 2)
+
+
+def LonLat(xy):
+    # Meters around CENTER as longitude/latitude (equirectangular, only to place test points)
+    lat0 = math.radians(CENTER[1])
+    return np.column_stack([CENTER[0] + np.degrees(xy[:, 0] / (geodesic.EARTH_RADIUS * math.cos(lat0))),
+                            CENTER[1] + np.degrees(xy[:, 1] / geodesic.EARTH_RADIUS)])
+
+
+def Measure(function, repeat, traced=True):
+    # Best wall time over the repeats, then one traced run for the peak memory allocated. Work
+    # done in other processes is invisible to tracemalloc, those stages are not traced
+    seconds = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = min(seconds, time.perf_counter() - start)
+    if not traced:
+        return result, seconds, None
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def ReferenceHuff(orig_xy, dest_xy, attr):
+    # GravityModel row by row: near table, 0-10 rescaling, num = attr / exp(2 * dist), prob per origin
+    dist = [[math.hypot(ox - dx, oy - dy) for dx, dy in dest_xy] for ox, oy in orig_xy]
+    min_dist = min(min(row) for row in dist)
+    max_dist = max(max(row) for row in dist)
+    prob = []
+    for row in dist:
+        num = [a / math.exp((((d - min_dist) / (max_dist + 0.000001 - min_dist)) * 10) * 2) for d, a in zip(row, attr)]
+        total = sum(num)
+        prob.append([value / total for value in num])
+    return {"prob": np.array(prob)}
+
+
+def ReferenceGravity(xy, attr, num_neighbors=None):
+    # Gravity row by row: 1-10 rescaled distances, attr / dist, probability per IN_FID, sums per NEAR_FID.
+    # With num_neighbors an IN_FID row holds itself and its nearest NEAR_FIDs, found by sorting the row
+    n = len(xy)
+    near = [sorted((math.hypot(x1 - x2, y1 - y2), j) for j, (x2, y2) in enumerate(xy)) for x1, y1 in xy]
+    if num_neighbors:
+        near = [row[:num_neighbors + 1] for row in near]
+    max_dist = max(max(d for d, j in row) for row in near)
+    gravity_index = [0.0] * n
+    movement = [0.0] * n
+    for i, row in enumerate(near):
+        weighted = [(attr[j] / (1 + d * 9 / max_dist), j) for d, j in row]
+        total = sum(value for value, j in weighted)
+        for value, j in weighted:
+            prob = value / total * 100
+            gravity_index[j] += prob
+            movement[j] += prob / 100 * attr[i]
+    net_movement = [(m - a) / a * 100 for m, a in zip(movement, attr)]
+    return {"gravity_index": np.array(gravity_index), "net_movement": np.array(net_movement)}
+
+
+def ReferenceCentrality(xy, attr, num_neighbors=None):
+    # WeightedCentralityScore as the original script: TS_* fields, then their min and max. With
+    # num_neighbors SUM_DIST adds the smallest distances of each row, self excluded
+    n = len(xy)
+    dist = [sorted(math.hypot(x1 - x2, y1 - y2) for j, (x2, y2) in enumerate(xy) if j != i) for i, (x1, y1) in enumerate(xy)]
+    sum_dist = [sum(row[:num_neighbors] if num_neighbors else row) for row in dist]
+    cx = sum(x * a for (x, y), a in zip(xy, attr)) / sum(attr)
+    cy = sum(y * a for (x, y), a in zip(xy, attr)) / sum(attr)
+    center_dist = [math.hypot(x - cx, y - cy) for x, y in xy]
+    mean_dist, mean_center = sum(sum_dist) / n, sum(center_dist) / n
+    ts_dist = [1 / (1 + d / mean_dist) for d in sum_dist]
+    ts_center = [1 / (1 + d / mean_center) for d in center_dist]
+
+    def rescale(values):
+        low, high = min(values), max(values)
+        return [(value - low) / (high - low) for value in values]
+
+    index = [a + ((d + c) / 2) / 2 for a, d, c in zip(rescale(list(attr)), rescale(ts_dist), rescale(ts_center))]
+    return {"sum_dist": np.array(sum_dist), "index": np.array(index)}
+
+
+def ReferenceNeighbors(xy, rows, distance, num_neighbors=None, radius=None):
+    # Near table rows by brute force: the self pair at 0, then the distances to all other features
+    # sorted, the num_neighbors smallest or those within radius
+    reference = []
+    for i in rows:
+        others = sorted(distance(xy[i], point) for j, point in enumerate(xy) if j != i)
+        if radius is not None:
+            others = [d for d in others if d <= radius]
+        reference.append([0.0] + (others[:num_neighbors] if num_neighbors else others))
+    return reference
+
+
+def PlanarDistance(p, q):
+    return math.hypot(p[0] - q[0], p[1] - q[1])
+
+
+def HaversineDistance(p, q):
+    # Great circle distance on the mean Earth sphere, one pair at a time
+    lon1, lat1, lon2, lat2 = map(math.radians, (p[0], p[1], q[0], q[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * geodesic.EARTH_RADIUS * math.asin(math.sqrt(min(max(h, 0.0), 1.0)))
+
+
+def VincentyDistance(p, q, iterations=200):
+    # Distance on the WGS84 ellipsoid by Vincenty's inverse formula, iterated to 1e-12 radians
+    a, f = geodesic.WGS84_A, geodesic.WGS84_F
+    b = a * (1 - f)
+    L = math.radians(q[0] - p[0])
+    U1 = math.atan((1 - f) * math.tan(math.radians(p[1])))
+    U2 = math.atan((1 - f) * math.tan(math.radians(q[1])))
+    sinU1, cosU1, sinU2, cosU2 = math.sin(U1), math.cos(U1), math.sin(U2), math.cos(U2)
+    lam = L
+    for _ in range(iterations):
+        sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+        sin_sigma = math.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+        if sin_sigma == 0:
+            return 0.0
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = cosU1 * cosU2 * sin_lam / sin_sigma
+        cos2_alpha = 1 - sin_alpha ** 2
+        cos_2sm = cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha if cos2_alpha else 0.0
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        previous = lam
+        lam = L + (1 - C) * f * sin_alpha * (sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        if abs(lam - previous) < 1e-12:
+            break
+    u2 = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sm + B / 4 * (cos_sigma * (-1 + 2 * cos_2sm ** 2)
+                                                      - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+    return b * A * (sigma - delta_sigma)
+
+
+def Compare(tool, pairs, outputs, reference, rtol=RTOL):
+    # One check per output array: largest absolute and relative error against the reference
+    checks = []
+    for name, expected in reference.items():
+        actual = np.asarray(outputs[name], dtype="f8")
+        error = np.abs(actual - expected)
+        scale = np.abs(expected)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            relative = np.where(scale > 0, error / scale, error)
+        checks.append({"tool": tool, "pairs": pairs, "output": name,
+                       "max_abs_error": float(error.max(initial=0)), "max_rel_error": float(relative.max(initial=0)),
+                       "passed": bool(np.allclose(actual, expected, rtol=rtol, atol=ATOL))})
+    return checks
+
+
+def CompareGraph(tool, pairs, name, graph, rows, reference, rtol=RTOL):
+    # A near table against its reference rows: same number of pairs per row, same sorted distances
+    counts = np.diff(graph.indptr)[rows]
+    if not np.array_equal(counts, [len(row) for row in reference]):
+        return [{"tool": tool, "pairs": pairs, "output": name, "passed": False}]
+    actual = np.concatenate([graph.distances[graph.indptr[i]:graph.indptr[i + 1]] for i in rows] + [np.empty(0)])
+    return Compare(tool, pairs, {name: actual}, {name: np.array([d for row in reference for d in row])}, rtol)
+
+
+def HighestMatches(values, index):
+    # argmax outputs only have to point at a largest value, ties may go either way
+    rows = np.arange(len(values))
+    return bool(np.allclose(values[rows, index], values.max(axis=1), rtol=RTOL, atol=ATOL))
+
+
+def BenchmarkGravityModel(seed_xy, pairs, rng, repeat, tile_size, workers, reference_limit):
+    # Destinations around the shops, origins spread wider, about sqrt(pairs) of each
+    m = max(1, int(round(math.sqrt(pairs))))
+    n = max(1, pairs // m)
+    dest_xy, attr = Synthetic(seed_xy, m, 100, rng)
+    orig_xy, _ = Synthetic(seed_xy, n, 1500, rng)
+
+    # The same points as longitude/latitude for the geodesic methods
+    orig_lonlat, dest_lonlat = LonLat(orig_xy), LonLat(dest_xy)
+
+    stages = {}
+    dist, stages["distances"], peak_dist = Measure(lambda: tradearea.DistanceMatrix(orig_xy, dest_xy), repeat)
+    geodesic_dist, stages["geodesic_distances"], peak_geodesic = Measure(lambda: tradearea.DistanceMatrix(orig_lonlat, dest_lonlat, "GEODESIC"), repeat)
+    result, stages["probabilities"], peak_prob = Measure(lambda: tradearea.HuffModel(orig_xy, dest_xy, attr, None, None, dist), repeat)
+    tiled, stages["total"], peak_total = Measure(lambda: parallel.HuffModel(orig_xy, dest_xy, attr, tile_size, None, workers), repeat,
+                                                 parallel.WorkerCount(workers) <= 1)
+    peaks = {"distances": peak_dist, "geodesic_distances": peak_geodesic, "probabilities": peak_prob, "total": peak_total}
+
+    checks = []
+    if n * m <= reference_limit:
+        reference = ReferenceHuff(orig_xy.tolist(), dest_xy.tolist(), attr.tolist())
+        checks += Compare("GravityModel", n * m, {"prob": result.prob}, reference)
+        checks += Compare("GravityModel", n * m, {"prob_tiled": tiled.prob}, {"prob_tiled": reference["prob"]})
+        checks.append({"tool": "GravityModel", "pairs": n * m, "output": "high_dest", "passed": HighestMatches(reference["prob"], result.high_dest)})
+
+        # Geodesic kernels on a sample of pairs, the matrix through GEODESIC and the pairs through HAVERSINE
+        i, j = rng.integers(n, size=min(n * m, GEODESIC_SAMPLE)), rng.integers(m, size=min(n * m, GEODESIC_SAMPLE))
+        pairs_orig, pairs_dest = orig_lonlat[i].tolist(), dest_lonlat[j].tolist()
+        checks += Compare("GravityModel", n * m, {"geodesic": geodesic_dist[i, j]},
+                          {"geodesic": np.array([VincentyDistance(p, q) for p, q in zip(pairs_orig, pairs_dest)])}, GEODESIC_RTOL)
+        checks += Compare("GravityModel", n * m, {"haversine": geodesic.Distances(orig_lonlat[i], dest_lonlat[j], "HAVERSINE")},
+                          {"haversine": np.array([HaversineDistance(p, q) for p, q in zip(pairs_orig, pairs_dest)])})
+
+        # A cached matrix is stored tile by tile on the first call and read back memory-mapped after
+        with tempfile.TemporaryDirectory() as cache_dir:
+            stored = distcache.DistanceMatrix(orig_xy, dest_xy, cache_dir, "", "PLANAR", tile_size)
+            loaded = distcache.DistanceMatrix(orig_xy, dest_xy, cache_dir, "", "PLANAR", tile_size)
+            checks += Compare("GravityModel", n * m, {"cache_stored": np.array(stored), "cache_loaded": np.array(loaded)},
+                              {"cache_stored": dist, "cache_loaded": dist})
+            del stored, loaded
+    return Rows("GravityModel", n, m, stages, peaks), checks
+
+
+def BenchmarkGravity(seed_xy, pairs, rng, repeat, tile_size, workers, reference_limit):
+    # Every feature against every other one, so sqrt(pairs) features
+    n = max(2, int(round(math.sqrt(pairs))))
+    xy, attr = Synthetic(seed_xy, n, 300, rng)
+
+    lonlat = LonLat(xy)
+
+    stages = {}
+    dist, stages["distances"], peak_dist = Measure(lambda: tradearea.DistanceMatrix(xy, xy), repeat)
+    result, stages["interaction"], peak_interaction = Measure(lambda: tradearea.GravityInteraction(xy, attr, None, None, None, None, dist), repeat)
+    tiled, stages["total"], peak_total = Measure(lambda: parallel.GravityInteraction(xy, attr, tile_size, None, None, None, workers), repeat,
+                                                 parallel.WorkerCount(workers) <= 1)
+    graph, stages["neighbors"], peak_neighbors = Measure(lambda: neighbors.SelfNeighbors(xy, NEIGHBORS), repeat)
+    sparse, stages["sparse_interaction"], peak_sparse = Measure(lambda: tradearea.SparseGravityInteraction(graph, attr), repeat)
+    radius_graph, stages["radius_neighbors"], peak_radius = Measure(lambda: neighbors.SelfNeighbors(xy, None, RADIUS), repeat)
+    geodesic_graph, stages["geodesic_neighbors"], peak_geodesic = Measure(lambda: neighbors.SelfNeighbors(lonlat, NEIGHBORS, None, "GEODESIC"), repeat)
+    peaks = {"distances": peak_dist, "interaction": peak_interaction, "total": peak_total, "neighbors": peak_neighbors,
+             "sparse_interaction": peak_sparse, "radius_neighbors": peak_radius, "geodesic_neighbors": peak_geodesic}
+
+    checks = []
+    if n * n <= reference_limit:
+        reference = ReferenceGravity(xy.tolist(), attr.tolist())
+        checks += Compare("Gravity", n * n, {"gravity_index": result.gravity_index, "net_movement": result.net_movement}, reference)
+        checks += Compare("Gravity", n * n, {"gravity_index_tiled": tiled.gravity_index}, {"gravity_index_tiled": reference["gravity_index"]})
+
+        # Near tables against sorted rows of all distances, the geodesic one on a sample of rows
+        # with Vincenty distances
+        points, rows = xy.tolist(), range(n)
+        checks += CompareGraph("Gravity", n * n, "neighbors", graph, rows, ReferenceNeighbors(points, rows, PlanarDistance, NEIGHBORS))
+        checks += CompareGraph("Gravity", n * n, "radius_neighbors", radius_graph, rows, ReferenceNeighbors(points, rows, PlanarDistance, None, RADIUS))
+        rows = sorted(rng.choice(n, min(n, GEODESIC_SAMPLE // n + 1), replace=False).tolist())
+        checks += CompareGraph("Gravity", n * n, "geodesic_neighbors", geodesic_graph, rows,
+                               ReferenceNeighbors(lonlat.tolist(), rows, VincentyDistance, NEIGHBORS), GEODESIC_RTOL)
+
+        sparse_reference = ReferenceGravity(points, attr.tolist(), NEIGHBORS)
+        checks += Compare("Gravity", n * n, {"sparse_gravity_index": sparse.gravity_index, "sparse_net_movement": sparse.net_movement},
+                          {"sparse_gravity_index": sparse_reference["gravity_index"], "sparse_net_movement": sparse_reference["net_movement"]})
+
+        # A cached near table is the same graph after the round trip
+        with tempfile.TemporaryDirectory() as cache_dir:
+            distcache.SelfNeighbors(xy, NEIGHBORS, None, cache_dir)
+            cached = distcache.SelfNeighbors(xy, NEIGHBORS, None, cache_dir)
+            checks.append({"tool": "Gravity", "pairs": n * n, "output": "cache_neighbors",
+                           "passed": all(np.array_equal(a, b) for a, b in zip(cached, graph))})
+            del cached
+
+    # The near table stages only score the pairs in their graph
+    counts = {"neighbors": len(graph.indices), "sparse_interaction": len(graph.indices),
+              "radius_neighbors": len(radius_graph.indices), "geodesic_neighbors": len(geodesic_graph.indices)}
+    return Rows("Gravity", n, n, stages, peaks, counts), checks
+
+
+def BenchmarkCentrality(seed_xy, pairs, rng, repeat, tile_size, workers, reference_limit):
+    n = max(2, int(round(math.sqrt(pairs))))
+    xy, attr = Synthetic(seed_xy, n, 300, rng)
+
+    def Index(sum_dist):
+        center = (xy * attr[:, None]).sum(axis=0) / attr.sum()
+        center_dist = np.hypot(*(xy - center).T)
+        stats = tradearea.CentralityStatistics(zip(attr, sum_dist, center_dist))
+        return tradearea.CentralityIndex(attr, sum_dist, center_dist, stats)
+
+    stages = {}
+    sum_dist, stages["sum_distances"], peak_sum = Measure(lambda: tradearea.SumDistances(xy, None, tile_size), repeat)
+    index, stages["index"], peak_index = Measure(lambda: Index(sum_dist), repeat)
+    sum_near, stages["sum_neighbors"], peak_near = Measure(lambda: tradearea.SumDistances(xy, NEIGHBORS, tile_size), repeat)
+    peaks = {"sum_distances": peak_sum, "index": peak_index, "sum_neighbors": peak_near}
+
+    checks = []
+    if n * n <= reference_limit:
+        checks += Compare("WeightedCentralityScore", n * n, {"sum_dist": sum_dist, "index": index}, ReferenceCentrality(xy.tolist(), attr.tolist()))
+        reference = ReferenceCentrality(xy.tolist(), attr.tolist(), NEIGHBORS)
+        checks += Compare("WeightedCentralityScore", n * n, {"sum_neighbors": sum_near, "index_neighbors": Index(sum_near)},
+                          {"sum_neighbors": reference["sum_dist"], "index_neighbors": reference["index"]})
+    # The index is one value per feature, the nearest sums cover each feature and its neighbors
+    counts = {"index": n, "sum_neighbors": n * min(NEIGHBORS + 1, n)}
+    return Rows("WeightedCentralityScore", n, n, stages, peaks, counts), checks
+
+
+def Rows(tool, n_orig, n_dest, stages, peaks, counts=None):
+    # Report rows of one tool and size. pairs is the size of the run (origins x destinations), the
+    # key baselines are matched on; stage_pairs and the throughput count the pairs each stage
+    # scores, all of them unless counts gives fewer (near tables, per feature stages)
+    pairs = n_orig * n_dest
+    counts = counts or {}
+    return [{"tool": tool, "stage": stage, "pairs": pairs, "stage_pairs": counts.get(stage, pairs), "origins": n_orig,
+             "destinations": n_dest, "seconds": seconds, "peak_bytes": peaks[stage],
+             "pairs_per_second": counts.get(stage, pairs) / seconds if seconds > 0 else None}
+            for stage, seconds in stages.items()]
+
+
+BENCHMARKS = {"GravityModel": BenchmarkGravityModel,
+              "Gravity": BenchmarkGravity,
+              "WeightedCentralityScore": BenchmarkCentrality}
+
+
+def Regressions(results, baseline, slowdown):
+    # Stages at least slowdown times (and NOISE seconds) slower than in the baseline report, matched by
+    # tool, stage and pairs
+    previous = {(row["tool"], row["stage"], row["pairs"]): row for row in baseline.get("results", [])}
+    regressions = []
+    for row in results:
+        old = previous.get((row["tool"], row["stage"], row["pairs"]))
+        if old and row["seconds"] > max(old["seconds"] * slowdown, old["seconds"] + NOISE):
+            regressions.append({"tool": row["tool"], "stage": row["stage"], "pairs": row["pairs"],
+                                "seconds": row["seconds"], "baseline_seconds": old["seconds"],
+                                "ratio": row["seconds"] / old["seconds"]})
+    return regressions
+
+
+def Benchmark(sizes=SIZES, tools=TOOLS, repeat=3, tile_size=None, workers=1, reference_limit=max(SIZES), seed=0,
+              baseline=None, slowdown=1.25, progress=None):
+    # Run every tool at every size and return the report
+    seed_xy = SeedPoints()
+    results, checks = [], []
+    for pairs in sizes:
+        for tool in tools:
+            rng = np.random.default_rng([seed, pairs, TOOLS.index(tool)])
+            rows, tool_checks = BENCHMARKS[tool](seed_xy, int(pairs), rng, repeat, tile_size, workers, reference_limit)
+            results += rows
+            checks += tool_checks
+            if progress is not None:
+                for row in rows:
+                    peak = f"{row['peak_bytes'] / 1024 ** 2:.1f} MB" if row["peak_bytes"] is not None else "not traced"
+                    progress(f"{row['tool']} {row['stage']}: {row['stage_pairs']:,} pairs in {row['seconds']:.4f}s "
+                             f"({row['pairs_per_second'] or 0:,.0f} pairs/s, peak {peak})")
+                for check in tool_checks:
+                    if not check["passed"]:
+                        progress(f"FAILED {check['tool']} {check['output']} at {check['pairs']:,} pairs")
+
+    report = {"created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+              "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                              "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()},
+              "settings": {"sizes": list(sizes), "tools": list(tools), "repeat": repeat, "tile_size": tile_size,
+                           "workers": workers, "reference_limit": reference_limit, "seed": seed,
+                           "rtol": RTOL, "atol": ATOL, "geodesic_rtol": GEODESIC_RTOL, "neighbors": NEIGHBORS, "radius": RADIUS,
+                           "slowdown": slowdown},
+              "results": results,
+              "checks": checks}
+    if baseline is not None:
+        report["regressions"] = Regressions(results, baseline, slowdown)
+    return report
+
+
+def Arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and regression checks of the trade area tools")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="origin x destination pairs per run")
+    parser.add_argument("--tools", nargs="+", default=TOOLS, choices=TOOLS)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one is reported")
+    parser.add_argument("--tile-size", type=int)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--reference-limit", type=int, default=max(SIZES), help="largest size checked against the reference")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="JSON report path, standard output when not given")
+    parser.add_argument("--baseline", help="earlier report to compare the timings with")
+    parser.add_argument("--slowdown", type=float, default=1.25, help="slowdown factor that counts as a regression")
+    return parser.parse_args(argv)
+
+
+# Run the script
+if __name__ == '__main__':
+    args = Arguments()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    report = Benchmark(args.sizes, args.tools, args.repeat, args.tile_size, args.workers, args.reference_limit, args.seed,
+                       baseline, args.slowdown, lambda message: print(message, file=sys.stderr))
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    failed = [check for check in report["checks"] if not check["passed"]]
+    for regression in report.get("regressions", []):
+        print(f"REGRESSION {regression['tool']} {regression['stage']} at {regression['pairs']:,} pairs: "
+              f"{regression['seconds']:.4f}s vs {regression['baseline_seconds']:.4f}s", file=sys.stderr)
+    sys.exit(1 if failed or report.get("regressions") else 0)
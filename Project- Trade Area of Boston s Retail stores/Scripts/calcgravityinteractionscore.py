@@ -3,8 +3,22 @@ import arcpy
 import os
 import sys
 
+import numpy as np
+
+import decay
+import distcache
+import gpprofiling
+import neighbors
+import parallel
+import profiling
+import tradearea
+
 # Main function, all functions run in GravityModel
-def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
+def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights, engine="GEOPROCESSING", tile_size=None, workers=1, cache_dir=None, method="PLANAR", decay_spec=None):
+    # The NumPy engine runs in-process and does not need the ArcInfo license
+    if engine.upper() == "NUMPY":
+        return GravityNumPy(in_dest, attr_field, out_fc, num_neighbors, radius, tile_size, workers, cache_dir, method, decay_spec, out_weights)
+
     # Make sure ArcInfo license is available
     if arcpy.ProductInfo().lower() not in ['arcinfo']:
         arcpy.AddError("Tool requires an ArcInfo license.")
@@ -15,6 +29,7 @@ def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
     arcpy.env.qualifiedFieldNames = False
 
     # Make output feature class
+    profiling.Stage("output", lambda: gpprofiling.RowCount(out_fc))
     dest_desc = arcpy.Describe(in_dest)
     fieldmappings = MakeFieldMappings(in_dest, dest_desc.OIDFieldName)
     arcpy.FeatureClassToFeatureClass_conversion(in_dest, os.path.dirname(out_fc), os.path.basename(out_fc), "", fieldmappings)
@@ -22,7 +37,9 @@ def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
     # Calculate distances between all origins and destinations
     if not out_weights:
         out_weights = f"{os.path.dirname(out_fc)}/gravity_near_table"
-    nearmatrix = arcpy.analysis.GenerateNearTable(in_dest, in_dest, out_weights, radius, "", "", False, num_neighbors)#, "GEODESIC") #geodesic too slow for polys
+    near_rows = lambda: gpprofiling.RowCount(out_weights)
+    profiling.Stage("near_table", near_rows)
+    nearmatrix = arcpy.analysis.GenerateNearTable(in_dest, in_dest, out_weights, radius, "", "", False, num_neighbors, "PLANAR" if method.upper() == "PLANAR" else "GEODESIC") #geodesic too slow for polys, use the NUMPY engine
     arcpy.Append_management(in_dest, nearmatrix, "NO_TEST", f'IN_FID "IN_FID" true true false 4 Long 0 0,First,#,{in_dest},{dest_desc.OIDFieldName},-1,-1;NEAR_FID "NEAR_FID" true true false 4 Long 0 0,First,#,{in_dest},{dest_desc.OIDFieldName},-1,-1')
     with arcpy.da.UpdateCursor(nearmatrix, ["NEAR_DIST"], "IN_FID = NEAR_FID") as ucur:
         for row in ucur:
@@ -39,6 +56,7 @@ def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
     max_dist = next(arcpy.da.SearchCursor(nearmatrix, ["NEAR_DIST"], sql_clause=(None, 'ORDER BY NEAR_DIST DESC')))[0]
     
     # Calculate the spatial interaction scores per dest-origin pair
+    profiling.Stage("join_weights", near_rows)
     arcpy.JoinField_management(nearmatrix, "IN_FID", in_dest, dest_desc.OIDFieldName, attr_field)
     arcpy.AlterField_management(nearmatrix, attr_field, f"{attr_field}_IN", clear_field_alias=True)
     arcpy.JoinField_management(nearmatrix, "NEAR_FID", in_dest, dest_desc.OIDFieldName, attr_field)
@@ -46,6 +64,7 @@ def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
     arcpy.SetProgressorPosition()
     arcpy.SetProgressorLabel(f"2/6 Added {attr_field} to matrix") 
     
+    profiling.Stage("weight_x_inv_distance", near_rows)
     with arcpy.da.UpdateCursor(nearmatrix, [distance_attr_field, "NEAR_DIST", f"{attr_field}_NEAR"]) as ucur:
         for row in ucur:
             row[0] = row[2] * (1/rescale(row[1], min_dist, max_dist, 1, 10))
@@ -54,6 +73,7 @@ def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
     arcpy.SetProgressorLabel("3/6 Calculated weight x inv. distance")    
     
     # Calculate Probability
+    profiling.Stage("probabilities", near_rows)
     sumnum = arcpy.analysis.Statistics(nearmatrix, "in_memory/sumnum", [[distance_attr_field, "SUM"]], "IN_FID")
     arcpy.JoinField_management(nearmatrix, "IN_FID", sumnum, "IN_FID", f"SUM_{distance_attr_field}")
     arcpy.CalculateField_management(nearmatrix, "PROBABILITY", f"(!{distance_attr_field}! / !SUM_{distance_attr_field}!) * 100", "PYTHON3", "", "DOUBLE")
@@ -65,6 +85,7 @@ def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
     arcpy.SetProgressorLabel("4/6 Calculated and summarized probabilities")  
     
     # Join 
+    profiling.Stage("gravity_index", near_rows)
     score_stats = arcpy.Statistics_analysis(nearmatrix, "in_memory/score_stats", [["PROBABILITY", "SUM"], [f"{attr_field}_MOVEMENT","SUM"]], "NEAR_FID")
     arcpy.JoinField_management(out_fc, "IN_FID", score_stats, "NEAR_FID", ["SUM_PROBABILITY", f"SUM_{attr_field}_MOVEMENT"])
     arcpy.AlterField_management(out_fc, "SUM_PROBABILITY", "GRAVITY_INDEX", "Gravity Index (High values have higher weights and spatial interaction/influence)")
@@ -75,6 +96,7 @@ def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
     arcpy.SetProgressorLabel("5/6 Calculate gravity index and net movement")  
     
     # Calculate the highest attraction feature
+    profiling.Stage("highest_probability", near_rows)
     maxprob = arcpy.analysis.Statistics(nearmatrix, f"{os.path.dirname(out_fc)}/maxprob", "PROBABILITY MAX", "IN_FID")
     arcpy.SetProgressorPosition()
     arcpy.SetProgressorLabel("6/6 Calculating highest probabilities")
@@ -82,6 +104,90 @@ def Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights):
     arcpy.JoinField_management(out_fc, "IN_FID", maxprob, "IN_FID", "NEAR_FID")
     arcpy.Delete_management(maxprob)
     arcpy.AlterField_management(out_fc, "NEAR_FID", "MAX_PROB_IN_FID", "IN_FID With Highest Movement Probability")
+
+# Same outputs as Gravity, with features streamed through tradearea.GravityInteraction in tiles,
+# or over the sparse neighbors of each feature when num_neighbors or radius is set
+def GravityNumPy(in_dest, attr_field, out_fc, num_neighbors, radius, tile_size=None, workers=1, cache_dir=None, method="PLANAR", decay_spec=None, out_weights=None):
+    arcpy.env.overwriteOutput = True
+
+    # Make output feature class
+    profiling.Stage("output", lambda: gpprofiling.RowCount(out_fc))
+    dest_desc = arcpy.Describe(in_dest)
+    fieldmappings = MakeFieldMappings(in_dest, dest_desc.OIDFieldName)
+    arcpy.FeatureClassToFeatureClass_conversion(in_dest, os.path.dirname(out_fc), os.path.basename(out_fc), "", fieldmappings)
+
+    # Geodesic methods work on longitude/latitude with the radius in meters
+    method = method.upper()
+    geographic = dest_desc.spatialReference.GCS if method != "PLANAR" else None
+    profiling.Stage("read")
+    dest = arcpy.da.FeatureClassToNumPyArray(in_dest, ["OID@", "SHAPE@XY", attr_field], null_value={attr_field: 0}, spatial_reference=geographic)
+    profiling.Rows(len(dest))
+
+    num_neighbors = int(num_neighbors) if num_neighbors else None
+    if radius and method != "PLANAR":
+        radius = LinearUnitToMeters(radius, dest_desc.spatialReference)
+    elif radius:
+        radius = LinearUnitToMapUnits(radius, dest_desc.spatialReference)
+
+    # Reuse the distance matrix or neighbor graph of an earlier run on the same features
+    dist = graph = None
+    if cache_dir and (num_neighbors or radius):
+        profiling.Stage("neighbors", len(dest))
+        graph = distcache.SelfNeighbors(dest["SHAPE@XY"], num_neighbors, radius, cache_dir, dest_desc.spatialReference.exportToString(), method)
+    elif cache_dir:
+        profiling.Stage("distances", len(dest) * len(dest))
+        dist = distcache.DistanceMatrix(dest["SHAPE@XY"], dest["SHAPE@XY"], cache_dir, dest_desc.spatialReference.exportToString(), method, tile_size)
+
+    # The neighbor graph is also written out as the weights matrix, build it once here
+    if out_weights and graph is None and (num_neighbors or radius):
+        profiling.Stage("neighbors", len(dest))
+        graph = neighbors.SelfNeighbors(dest["SHAPE@XY"], num_neighbors, radius, method)
+
+    # Rows are the pairs scored: the whole matrix, or the cached neighbor graph
+    pairs = len(graph.indices) if graph is not None else len(dest) * len(dest)
+    profiling.Stage("interaction", None if (num_neighbors or radius) and graph is None else pairs)
+
+    # Distance decay of the 1-10 rescaled distance, inverse distance (POWER 1) by default
+    decay_function = decay.Decay(decay_spec, 1.0) if decay_spec else None
+    result = parallel.GravityInteraction(dest["SHAPE@XY"], dest[attr_field], tile_size, arcpy.AddMessage,
+                                         num_neighbors, radius, workers, dist, graph, decay_function, method)
+
+    # Write the scores back in one pass
+    profiling.Stage("write", len(dest))
+    scores = np.empty(len(dest), dtype=[("IN_FID", "<i4"), ("GRAVITY_INDEX", "<f8"), (f"{attr_field}_NET_MOVEMENT", "<f8"), ("MAX_PROB_IN_FID", "<i4")])
+    scores["IN_FID"] = dest["OID@"]
+    scores["GRAVITY_INDEX"] = result.gravity_index
+    scores[f"{attr_field}_NET_MOVEMENT"] = result.net_movement
+    scores["MAX_PROB_IN_FID"] = dest["OID@"][result.max_prob]
+    arcpy.da.ExtendTable(out_fc, "IN_FID", scores, "IN_FID", False)
+    arcpy.AlterField_management(out_fc, "GRAVITY_INDEX", "", "Gravity Index (High values have higher weights and spatial interaction/influence)")
+    arcpy.AlterField_management(out_fc, f"{attr_field}_NET_MOVEMENT", "", f"{attr_field} Net Projected Movement %")
+    arcpy.AlterField_management(out_fc, "MAX_PROB_IN_FID", "", "IN_FID With Highest Movement Probability")
+
+    if out_weights:
+        profiling.Stage("weights", pairs)
+        WriteNearTable(out_weights, dest["OID@"], dest["SHAPE@XY"], tile_size, dist, graph, method)
+
+def WriteNearTable(out_weights, oids, xy, tile_size=None, dist=None, graph=None, method="PLANAR"):
+    # IN_FID, NEAR_FID and NEAR_DIST of every scored pair (self pairs at 0), the near table the
+    # geoprocessing engine leaves in out_weights: the neighbor graph, or the full matrix tile by tile
+    if arcpy.Exists(out_weights):
+        arcpy.Delete_management(out_weights)
+    n = len(oids)
+    if graph is not None:
+        tiles = [(np.repeat(np.arange(n), np.diff(graph.indptr)), graph.indices, graph.distances)]
+    else:
+        tiles = ((np.repeat(np.arange(tile.start, tile.stop), n), np.tile(np.arange(n), tile.stop - tile.start),
+                  tradearea.TileDistances(xy, xy, tile, dist, method).ravel()) for tile in tradearea.Tiles(n, tile_size))
+    for i, (rows, points, distances) in enumerate(tiles):
+        near = np.empty(len(rows), dtype=[("IN_FID", "<i4"), ("NEAR_FID", "<i4"), ("NEAR_DIST", "<f8")])
+        near["IN_FID"], near["NEAR_FID"], near["NEAR_DIST"] = oids[rows], oids[points], distances
+        if i == 0:
+            arcpy.da.NumPyArrayToTable(near, out_weights)
+        else:
+            arcpy.da.NumPyArrayToTable(near, "in_memory/near_tile")
+            arcpy.Append_management("in_memory/near_tile", out_weights, "NO_TEST")
+            arcpy.Delete_management("in_memory/near_tile")
     
 def MakeFieldMappings(fc, fid_field):
     fieldmappings = arcpy.FieldMappings()
@@ -96,6 +202,20 @@ def MakeFieldMappings(fc, fid_field):
     return fieldmappings
 
         
+def LinearUnitToMapUnits(linear_unit, spatial_reference):
+    # "1000 Meters" -> 1000 converted to the units of the coordinates; no unit means map units
+    value, _, unit = str(linear_unit).strip().partition(" ")
+    if not unit or unit.lower() == "unknown" or not spatial_reference.linearUnitName:
+        return float(value)
+    return float(value) * arcpy.LinearUnitConversionFactor(unit, spatial_reference.linearUnitName)
+
+def LinearUnitToMeters(linear_unit, spatial_reference):
+    # Same for the geodesic methods, which measure in meters; no unit means map units
+    value, _, unit = str(linear_unit).strip().partition(" ")
+    if not unit or unit.lower() == "unknown":
+        return float(value) * (spatial_reference.metersPerUnit if spatial_reference.type == "Projected" else 1.0)
+    return float(value) * arcpy.LinearUnitConversionFactor(unit, "Meters")
+
 def rescale(val, in_min, in_max, out_min, out_max):
     return out_min + (val - in_min) * ((out_max - out_min) / (in_max - in_min))
 
@@ -108,9 +228,17 @@ if __name__ == '__main__':
     num_neighbors = arcpy.GetParameterAsText(3)
     radius = arcpy.GetParameterAsText(4)
     out_weights = arcpy.GetParameterAsText(5)
+    engine = arcpy.GetParameterAsText(6) if arcpy.GetArgumentCount() > 6 else ""
+    tile_size = arcpy.GetParameterAsText(7) if arcpy.GetArgumentCount() > 7 else ""
+    workers = arcpy.GetParameterAsText(8) if arcpy.GetArgumentCount() > 8 else ""
+    cache_dir = arcpy.GetParameterAsText(9) if arcpy.GetArgumentCount() > 9 else ""
+    method = arcpy.GetParameterAsText(10) if arcpy.GetArgumentCount() > 10 else ""
+    decay_spec = arcpy.GetParameterAsText(11) if arcpy.GetArgumentCount() > 11 else ""
+    profile_path = arcpy.GetParameterAsText(12) if arcpy.GetArgumentCount() > 12 else ""
 
     # Run the main script
-    Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights)
+    with profiling.Profile("Gravity", profile_path or None, gpprofiling.WorkspaceRows):
+        Gravity(in_dest, attr_field, out_fc, num_neighbors, radius, out_weights, engine or "GEOPROCESSING", int(tile_size) if tile_size else None, int(workers) if workers else 1, cache_dir or None, method or "PLANAR", decay_spec or None)
     
     try:
         if arcpy.Describe(out_fc).shapeType ==  "Polygon":
@@ -0,0 +1,166 @@
+'''----------------------------------------------------------------------------------
+ Source Name: calibration.py
+ Description: Fits the Huff model (GravityModel) to observed patronage. The probability of an
+              origin visiting a destination is modelled as attr ^ alpha * decay(d; beta),
+              normalised per origin, with d the tool's rescaled distance. Given a table of
+              observed visits, alpha and beta are fitted by maximum likelihood (Newton) or least
+              squares on the visit shares (Gauss-Newton). alpha can be held fixed instead: the
+              Gravity Model weights destinations by attr ^ 1, so only a beta fitted with alpha 1
+              reproduces the fit there.
+
+              The features (log attractiveness and the decay term of each distance) are built
+              once from one distance matrix; every iteration is then a few vectorised passes
+              over it for the objective, gradient and curvature.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Fitted parameters. decay_spec is the decay.Decay text of the fitted decay, objective the log
+# likelihood (MLE) or the squared share error, times the seconds spent on each iteration
+CalibrationResult = namedtuple("CalibrationResult", ["alpha", "beta", "decay_spec", "objective", "iterations",
+                                                     "converged", "times"])
+
+# Decay functions whose log is linear in their parameter: log decay = beta * feature(d)
+STARTS = {"EXPONENTIAL": 2.0, "POWER": 1.0, "GAUSSIAN": 1 / 2.5 ** 2}
+
+
+def DecayFeature(dist, decay_name="EXPONENTIAL", offset=0.0):
+    # EXPONENTIAL exp(-beta * d), POWER (d + offset) ^ -beta, GAUSSIAN exp(-beta * d^2 / 2)
+    decay_name = decay_name.upper()
+    if decay_name == "EXPONENTIAL":
+        return -dist
+    if decay_name == "POWER":
+        with np.errstate(divide="ignore"):
+            return -np.log(dist + offset)
+    if decay_name == "GAUSSIAN":
+        return -0.5 * dist ** 2
+    raise ValueError(f"Cannot calibrate distance decay {decay_name}, use one of {', '.join(STARTS)}")
+
+
+def DecaySpec(decay_name, beta, offset=0.0):
+    # Fitted decay as a decay.Decay parameter
+    decay_name = decay_name.upper()
+    if decay_name == "POWER":
+        return f"POWER {beta:.6g} {offset:.6g}"
+    if decay_name == "GAUSSIAN":
+        return f"GAUSSIAN {1 / np.sqrt(beta):.6g}" if beta > 0 else "GAUSSIAN inf"
+    return f"{decay_name} {beta:.6g}"
+
+
+def VisitMatrix(orig_index, dest_index, counts, n_orig, n_dest):
+    # Dense origins x destinations visit counts from a visit table
+    visits = np.zeros(n_orig * n_dest)
+    np.add.at(visits, np.asarray(orig_index, dtype="i8") * n_dest + np.asarray(dest_index, dtype="i8"), np.asarray(counts, dtype="f8"))
+    return visits.reshape(n_orig, n_dest)
+
+
+def Probabilities(theta, features, base=0.0):
+    # Row normalised probabilities and their log, computed with the row max taken out. base is
+    # the utility of the fixed parameters
+    utility = np.tensordot(theta, features, axes=1) + base
+    utility -= utility.max(axis=1, keepdims=True)
+    expu = np.exp(utility)
+    total = expu.sum(axis=1, keepdims=True)
+    return expu / total, utility - np.log(total)
+
+
+def LikelihoodTerms(theta, features, visits, totals, base=0.0):
+    # Log likelihood, its gradient and its Hessian (multinomial logit)
+    prob, log_prob = Probabilities(theta, features, base)
+    mean = (features * prob[None]).sum(axis=2)
+    centered = features - mean[:, :, None]
+    loglik = (visits * log_prob).sum()
+    gradient = (centered * visits[None]).sum(axis=(1, 2))
+    weighted = centered * (prob * totals[:, None])[None]
+    hessian = -np.tensordot(weighted, centered, axes=([1, 2], [1, 2]))
+    return loglik, gradient, hessian
+
+
+def LeastSquaresTerms(theta, features, shares, totals, base=0.0):
+    # Visit weighted squared share error, its residuals and their Jacobian
+    prob, _ = Probabilities(theta, features, base)
+    mean = (features * prob[None]).sum(axis=2)
+    scale = np.sqrt(totals)[:, None]
+    residual = (prob - shares) * scale
+    jacobian = (features - mean[:, :, None]) * (prob * scale)[None]
+    return (residual ** 2).sum(), residual, jacobian
+
+
+def Calibrate(dist, attr, visits, decay_name="EXPONENTIAL", method="MLE", offset=0.0, iterations=200,
+              tolerance=1e-9, progress=None, alpha=None):
+    # dist is origins x destinations rescaled distances (tradearea.RescaleDistances), visits the
+    # observed counts of the same shape. Destinations without attractiveness are left out. With
+    # alpha given the attractiveness exponent is held there and only beta is fitted
+    attr = np.asarray(attr, dtype="f8")
+    valid = attr > 0
+    dist = np.asarray(dist, dtype="f8")[:, valid]
+    visits = np.asarray(visits, dtype="f8")[:, valid]
+    totals = visits.sum(axis=1)
+    log_attr = np.broadcast_to(np.log(attr[valid]), dist.shape)
+    if alpha is None:
+        features = np.stack([log_attr, DecayFeature(dist, decay_name, offset)])
+        base = np.zeros(dist.shape)
+        theta = np.array([1.0, STARTS.get(decay_name.upper(), 1.0)])
+    else:
+        features = DecayFeature(dist, decay_name, offset)[None]
+        base = alpha * log_attr
+        theta = np.array([STARTS.get(decay_name.upper(), 1.0)])
+
+    # Only origins with visits carry information
+    used = totals > 0
+    features, base, visits, totals = features[:, used], base[used], visits[used], totals[used]
+    shares = visits / totals[:, None]
+    maximise = method.upper() == "MLE"
+
+    def Parameters(theta):
+        # alpha and beta of the fitted parameters
+        return (theta[0], theta[1]) if alpha is None else (alpha, theta[0])
+
+    def Objective(theta):
+        if maximise:
+            return -LikelihoodTerms(theta, features, visits, totals, base)[0]
+        return LeastSquaresTerms(theta, features, shares, totals, base)[0]
+
+    times = []
+    converged = False
+    objective = Objective(theta)
+    for iteration in range(1, iterations + 1):
+        start = time.perf_counter()
+        if maximise:
+            # Newton step on the concave log likelihood
+            _, gradient, hessian = LikelihoodTerms(theta, features, visits, totals, base)
+            step = -np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+        else:
+            # Gauss-Newton step on the squared share error
+            _, residual, jacobian = LeastSquaresTerms(theta, features, shares, totals, base)
+            J = jacobian.reshape(len(theta), -1)
+            step = -np.linalg.lstsq(J @ J.T, J @ residual.ravel(), rcond=None)[0]
+
+        # Halve the step until the objective improves
+        size = 1.0
+        while size > 1e-6:
+            candidate = theta + size * step
+            value = Objective(candidate)
+            if np.isfinite(value) and value <= objective:
+                break
+            size /= 2
+        else:
+            candidate, value = theta, objective
+
+        improvement = objective - value
+        theta, objective = candidate, value
+        times.append(time.perf_counter() - start)
+        if progress is not None:
+            fitted_alpha, beta = Parameters(theta)
+            progress(f"Iteration {iteration}: alpha {fitted_alpha:.6g}, beta {beta:.6g}, objective {objective:.6g} in {times[-1] * 1000:.1f} ms")
+        if np.abs(size * step).max() <= tolerance or improvement <= tolerance * max(abs(objective), 1.0):
+            converged = True
+            break
+
+    fitted_alpha, beta = Parameters(theta)
+    return CalibrationResult(fitted_alpha, beta, DecaySpec(decay_name, beta, offset), -objective if maximise else objective,
+                             len(times), converged, times)
@@ -0,0 +1,74 @@
+'''----------------------------------------------------------------------------------
+ Source Name: decay.py
+ Description: Distance decay functions for the tradearea engine. Each one maps a whole array of
+              rescaled distances (0-10 in the Huff model, 1-10 in the spatial interaction
+              scores) to weights in one vectorised pass. Tools select one with a text parameter
+              naming the function and its parameters, e.g. "EXPONENTIAL 2" or "POWER 1.5 1".
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import functools
+
+import numpy as np
+
+
+def Exponential(dist, beta=2.0):
+    # 1 / exp(beta * d), the GravityModel default with beta 2
+    return np.exp(-beta * dist)
+
+
+def Power(dist, beta=1.0, offset=0.0):
+    # 1 / (d + offset) ^ beta, the Gravity default with beta 1. The Huff distances start at 0 and
+    # need an offset
+    with np.errstate(divide="ignore"):
+        return np.power(dist + offset, -beta)
+
+
+def Gaussian(dist, bandwidth=2.5):
+    return np.exp(-0.5 * (dist / bandwidth) ** 2)
+
+
+def Cutoff(dist, cutoff=5.0):
+    # Full weight up to the cutoff distance, none beyond
+    return (dist <= cutoff).astype("f8")
+
+
+def Piecewise(dist, *bands):
+    # Weight per distance band given as upper bound, weight pairs: "PIECEWISE 2 1 5 0.5 10 0.1".
+    # Distances past the last bound get no weight
+    bounds = np.asarray(bands[0::2], dtype="f8")
+    weights = np.append(np.asarray(bands[1::2], dtype="f8"), 0.0)
+    return weights[np.searchsorted(bounds, dist, side="left")]
+
+
+# Decay functions by tool parameter name
+DECAYS = {"EXPONENTIAL": Exponential,
+          "POWER": Power,
+          "GAUSSIAN": Gaussian,
+          "CUTOFF": Cutoff,
+          "PIECEWISE": Piecewise}
+
+
+def Evaluate(function, params, dist):
+    return function(dist, *params)
+
+
+def Decay(spec, start=0.0):
+    # "NAME p1 p2 ..." -> function of the distance array. A partial of module level functions, so
+    # it can be sent to worker processes. start is the smallest rescaled distance the function
+    # gets (0 in the Huff model, 1 in the spatial interaction scores)
+    name, *params = str(spec).split()
+    if name.upper() not in DECAYS:
+        raise ValueError(f"Unknown distance decay {name}, use one of {', '.join(DECAYS)}")
+    if name.upper() == "PIECEWISE" and (not params or len(params) % 2):
+        raise ValueError("PIECEWISE needs upper bound, weight pairs")
+    params = tuple(float(param) for param in params)
+    if name.upper() == "POWER" and start + (params[1] if len(params) > 1 else 0.0) <= 0:
+        # The closest pair would get an infinite weight
+        raise ValueError(f"POWER needs an offset above {0.0 - start:g} on distances starting at {start:g}, e.g. POWER 1.5 1")
+    return functools.partial(Evaluate, DECAYS[name.upper()], params)
+
+
+# Decay of each tool when none is given
+HUFF_DECAY = Decay("EXPONENTIAL 2")
+INTERACTION_DECAY = Decay("POWER 1", 1.0)
@@ -0,0 +1,172 @@
+'''----------------------------------------------------------------------------------
+ Source Name: distcache.py
+ Description: On-disk cache of distance matrices and neighbor graphs for the tradearea engine.
+              Entries are keyed by a hash of the coordinates, the spatial reference and the
+              distance method (planar or geodesic), stored as .npy files and opened memory-mapped, so a rerun with a
+              different attribute field or decay only reads the pages it needs. The oldest used
+              entries are evicted once the folder grows past its size limit.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import atexit
+import glob
+import hashlib
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+import neighbors
+import tradearea
+
+# Default cache folder and size limit
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "tradearea_cache")
+MAX_BYTES = 4 * 1024 ** 3
+
+# Run-only entries whose file could not be removed yet (still mapped, on Windows)
+_leftovers = []
+
+
+def CacheKey(*arrays, **options):
+    # Content hash of the input coordinates plus everything else that changes the distances
+    digest = hashlib.blake2b(digest_size=20)
+    for array in arrays:
+        array = np.ascontiguousarray(array, dtype="f8")
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    for name in sorted(options):
+        digest.update(f"{name}={options[name]};".encode())
+    return digest.hexdigest()
+
+
+def Load(cache_dir, key):
+    # Memory-mapped cache entry, or None. Touching the file marks it as recently used
+    path = os.path.join(cache_dir, f"{key}.npy")
+    try:
+        array = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    os.utime(path)
+    return array
+
+
+def Store(cache_dir, key, shape, dtype, fill, max_bytes=MAX_BYTES):
+    # Write a new entry through a memory-mapped temp file (fill(array) streams the values in),
+    # publish it with an atomic rename, evict and return it memory-mapped read-only. Entries
+    # bigger than max_bytes are not kept
+    if not np.prod(shape):
+        # Nothing to map, empty arrays are not worth caching
+        array = np.empty(shape, dtype)
+        fill(array)
+        return array
+    if np.prod(shape, dtype="i8") * np.dtype(dtype).itemsize > max_bytes:
+        # Larger than the whole cache: a temporary .npy for this run only, so the folder stays
+        # within its limit, the matrix is not held in memory and workers can still map it by path.
+        # The file goes once the array is no longer used
+        RemoveLeftovers()
+        handle, path = tempfile.mkstemp(suffix=".npy", prefix=f"{key}.")
+        os.close(handle)
+        try:
+            array = np.lib.format.open_memmap(path, "w+", dtype, shape)
+            fill(array)
+            array.flush()
+        except BaseException:
+            array = None
+            RemoveRunFile(path)
+            raise
+        weakref.finalize(array, RemoveRunFile, path)
+        return array
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.npy")
+    temp = f"{path}.{os.getpid()}.tmp"
+    array = np.lib.format.open_memmap(temp, "w+", dtype, shape)
+    try:
+        fill(array)
+        array.flush()
+    except BaseException:
+        del array
+        os.remove(temp)
+        raise
+    del array
+    os.replace(temp, path)
+    Evict(cache_dir, max_bytes, keep=path)
+    return np.load(path, mmap_mode="r")
+
+
+def RemoveRunFile(path):
+    # Delete a run-only entry. Windows refuses while the file is still mapped, it is tried again
+    # by the next Store and at exit
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        _leftovers.append(path)
+
+
+@atexit.register
+def RemoveLeftovers():
+    for path in list(_leftovers):
+        _leftovers.remove(path)
+        RemoveRunFile(path)
+
+
+def Evict(cache_dir, max_bytes=MAX_BYTES, keep=None):
+    # Remove least recently used entries until the folder fits in max_bytes
+    entries = []
+    for path in glob.glob(os.path.join(cache_dir, "*.npy")):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # Still mapped by another run (Windows), try again next time
+            continue
+        total -= size
+
+
+def DistanceMatrix(orig_xy, dest_xy, cache_dir=CACHE_DIR, spatial_reference="", method="PLANAR", tile_size=None, max_bytes=MAX_BYTES):
+    # Origins x destinations distance matrix, computed tile by tile on a miss. Geodesic methods
+    # take longitude/latitude coordinates (see tradearea.DistanceMatrix)
+    orig_xy = np.asarray(orig_xy, dtype="f8").reshape(-1, 2)
+    dest_xy = np.asarray(dest_xy, dtype="f8").reshape(-1, 2)
+    key = CacheKey(orig_xy, dest_xy, kind="matrix", spatial_reference=spatial_reference, method=method)
+    dist = Load(cache_dir, key)
+    if dist is not None:
+        return dist
+
+    def fill(array):
+        for tile in tradearea.Tiles(len(orig_xy), tile_size):
+            array[tile] = tradearea.DistanceMatrix(orig_xy[tile], dest_xy, method)
+    return Store(cache_dir, key, (len(orig_xy), len(dest_xy)), "f8", fill, max_bytes)
+
+
+def SelfNeighbors(xy, num_neighbors=None, radius=None, cache_dir=CACHE_DIR, spatial_reference="", method="PLANAR", max_bytes=MAX_BYTES):
+    # neighbors.SelfNeighbors graph, stored as one (row, index, distance) record per pair
+    xy = np.asarray(xy, dtype="f8").reshape(-1, 2)
+    key = CacheKey(xy, kind="neighbors", num_neighbors=num_neighbors or "", radius=radius or "",
+                   spatial_reference=spatial_reference, method=method)
+    pairs = Load(cache_dir, key)
+    if pairs is None:
+        graph = neighbors.SelfNeighbors(xy, num_neighbors, radius, method)
+
+        def fill(array):
+            array["row"] = np.repeat(np.arange(len(xy)), np.diff(graph.indptr))
+            array["index"] = graph.indices
+            array["distance"] = graph.distances
+        Store(cache_dir, key, (len(graph.indices),), [("row", "<i8"), ("index", "<i8"), ("distance", "<f8")], fill, max_bytes)
+        return graph
+
+    indptr = np.zeros(len(xy) + 1, dtype="i8")
+    np.cumsum(np.bincount(pairs["row"], minlength=len(xy)), out=indptr[1:])
+    return neighbors.NeighborGraph(indptr, np.asarray(pairs["index"]), np.asarray(pairs["distance"]))
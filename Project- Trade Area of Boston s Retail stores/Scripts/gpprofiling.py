@@ -0,0 +1,27 @@
+'''----------------------------------------------------------------------------------
+ Source Name: gpprofiling.py
+ Description: Geoprocessing side of profiling.py for the script tools: row counts of datasets
+              for the stage spans, and the rows held in the in-memory workspaces, passed to
+              profiling.Profile as its workspace callback.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import arcpy
+
+
+def RowCount(data):
+    return int(arcpy.management.GetCount(data)[0])
+
+
+def WorkspaceRows():
+    # Rows held in the in-memory workspaces, reported with every profile span
+    rows = 0
+    workspace = arcpy.env.workspace
+    try:
+        for memory in ["memory", "in_memory"]:
+            arcpy.env.workspace = memory
+            for data in (arcpy.ListTables() or []) + (arcpy.ListFeatureClasses() or []):
+                rows += RowCount(data)
+    finally:
+        arcpy.env.workspace = workspace
+    return rows
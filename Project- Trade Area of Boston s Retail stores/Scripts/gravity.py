@@ -9,8 +9,19 @@
               Destination Attractiveness Field (Field)
               Input Origins (Features Layer)
               Output Feature Class (Feature Class)
- Optional Arguments:
-              NA
+ Optional Arguments: (in TradeAreaTools.pyt, GravityModeling.tbx has the required arguments only)
+              Engine (String): GEOPROCESSING (default) or NUMPY, the in-process engine in tradearea.py
+              Tile Size (Long): NUMPY engine only, number of origins processed per block
+              Workers (Long): NUMPY engine only, worker processes (default 1, 0 for one per core)
+              Distance Cache Folder (Folder): NUMPY engine only, reuse distance matrices between runs
+              Distance Method (String): PLANAR (default), HAVERSINE or GEODESIC (ellipsoidal); the
+                  GEOPROCESSING engine runs HAVERSINE as GEODESIC
+              Distance Decay (String): NUMPY engine only, decay function and parameters of the 0-10
+                  rescaled distance, EXPONENTIAL 2 (default), POWER (with an offset, e.g. POWER 1.5 1),
+                  GAUSSIAN, CUTOFF or PIECEWISE (decay.py). Origins no destination reaches get
+                  zero probabilities and an empty HIGH_DEST
+              Profile File (File): time and memory of each stage, as JSON lines or a .json profile
+                  dump (profiling.py); TRADEAREA_PROFILE when not given
 
  Description: Calculates the probabilistic attraction an origin will feel towards a destination based on the distance
                between that origin and destination and the attractiveness (or mass, or utility) of the destination.
@@ -21,8 +32,20 @@ import arcpy
 import os
 import sys
 
+import numpy as np
+
+import decay
+import distcache
+import gpprofiling
+import parallel
+import profiling
+
 # Main function, all functions run in GravityModel
-def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc):
+def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc, engine="GEOPROCESSING", tile_size=None, workers=1, cache_dir=None, method="PLANAR", decay_spec=None):
+    # The NumPy engine runs in-process and does not need the ArcInfo license
+    if engine.upper() == "NUMPY":
+        return GravityModelNumPy(in_dest, name_field, attr_field, in_orig, out_fc, tile_size, workers, cache_dir, method, decay_spec)
+
     # Make sure ArcInfo license is available
     if arcpy.ProductInfo().lower() not in ['arcinfo']:
         arcpy.AddError("Tool requires an ArcInfo license.")
@@ -33,11 +56,14 @@ def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc):
     arcpy.env.qualifiedFieldNames = False
 
     # Calculate distances between all origins and destinations
-    nearmatrix = arcpy.analysis.GenerateNearTable(in_orig, in_dest, "in_memory/neartable", "", "", "", False)
+    near_rows = lambda: gpprofiling.RowCount("in_memory/neartable")
+    profiling.Stage("near_table", near_rows)
+    nearmatrix = arcpy.analysis.GenerateNearTable(in_orig, in_dest, "in_memory/neartable", "", "", "", False, "", "PLANAR" if method.upper() == "PLANAR" else "GEODESIC")
     arcpy.management.AddField(nearmatrix, "num", "DOUBLE")
     arcpy.management.AddField(nearmatrix, "prob", "DOUBLE")
 
     # Transform NEAR_DIST values to scale of 0-10
+    profiling.Stage("rescale", near_rows)
     minmaxstats = arcpy.analysis.Statistics(nearmatrix, "in_memory/minmaxstats", [["NEAR_DIST", "MIN"],["NEAR_DIST", "MAX"]])
     # Read the min and max values
     scur = arcpy.SearchCursor(minmaxstats)
@@ -54,6 +80,7 @@ def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc):
     arcpy.management.CalculateField(nearmatrix, "NEAR_DIST", """((!NEAR_DIST! - %s) / (float(%s) - %s)) * 10""" % (min, max + 0.000001, min), "PYTHON")
 
     # Join store attributes to the near table
+    profiling.Stage("numerator", near_rows)
     arcpy.management.MakeTableView(nearmatrix, "nearmatrix")
     arcpy.management.AddJoin("nearmatrix", "NEAR_FID", in_dest, arcpy.Describe(in_dest).OIDFieldName)
 
@@ -63,12 +90,14 @@ def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc):
     arcpy.management.RemoveJoin("nearmatrix", os.path.splitext(arcpy.Describe(in_dest).name)[0])
 
     # Calculate the gravity model denominator (SUM of mass X inverse distance squared for each origin) and probability
+    profiling.Stage("probabilities", near_rows)
     sumstats = arcpy.analysis.Statistics("nearmatrix", "in_memory/sumstats", "num SUM", "IN_FID")
     arcpy.management.AddJoin("nearmatrix", "IN_FID", sumstats, "IN_FID")
     arcpy.management.CalculateField("nearmatrix", "prob", "!num! / !SUM_num!", "PYTHON")
     arcpy.management.RemoveJoin("nearmatrix", os.path.splitext(os.path.basename(sumstats.getOutput(0)))[0])
 
     # Create the pivoted probability table (the destination names become attribute fields)
+    profiling.Stage("pivot", near_rows)
     arcpy.management.AddJoin("nearmatrix", "NEAR_FID", in_dest, arcpy.Describe(in_dest).OIDFieldName)
     pivot = arcpy.management.PivotTable("nearmatrix", "neartable.IN_FID", "%s.%s" % (os.path.splitext(arcpy.Describe(in_dest).name)[0], name_field), "neartable.prob", "in_memory/pivoted")
 
@@ -76,6 +105,7 @@ def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc):
     keepfields = ["pivoted_%s" % field.name for field in arcpy.ListFields(pivot) if not field.required]
 
     # Join the probability table to the origins layers
+    profiling.Stage("output", lambda: gpprofiling.RowCount(out_fc))
     arcpy.management.MakeFeatureLayer(in_orig, "origins")
     arcpy.management.AddJoin("origins", arcpy.Describe(in_orig).OIDFieldName, pivot, "IN_FID")
 
@@ -97,15 +127,17 @@ def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc):
     arcpy.conversion.FeatureClassToFeatureClass("origins", os.path.dirname(out_fc), os.path.basename(out_fc), "", fieldmappings)
 
     # Find the destination with the largest probability for each origin
+    profiling.Stage("high_dest", near_rows)
     market_dict = {}
-    scur = arcpy.SearchCursor("nearmatrix", "", "", ";".join(["neartable.IN_FID", "neartable.NEAR_FID", "%s.%s" % (os.path.splitext(arcpy.Describe(in_dest).name)[0], name_field), "neartable.prob"]))
+    dest_name_field = "%s.%s" % (os.path.splitext(arcpy.Describe(in_dest).name)[0], name_field)
+    scur = arcpy.SearchCursor("nearmatrix", "", "", ";".join(["neartable.IN_FID", "neartable.NEAR_FID", dest_name_field, "neartable.prob"]))
     try:
         for row in scur:
             try:
                 if row.getValue("neartable.prob") > market_dict[row.getValue("neartable.IN_FID")][1]:
-                    market_dict[row.getValue("neartable.IN_FID")] = [row.getValue("%s.%s" % (os.path.splitext(arcpy.Describe(in_dest).name)[0], name_field)), row.getValue("neartable.prob")]
+                    market_dict[row.getValue("neartable.IN_FID")] = [row.getValue(dest_name_field), row.getValue("neartable.prob")]
             except:
-                market_dict[row.getValue("neartable.IN_FID")] = [row.getValue("%s.%s" % (os.path.splitext(arcpy.Describe(in_dest).name)[0], name_field)), row.getValue("neartable.prob")]
+                market_dict[row.getValue("neartable.IN_FID")] = [row.getValue(dest_name_field), row.getValue("neartable.prob")]
     except:
         raise
     finally:
@@ -126,9 +158,88 @@ def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc):
         if ucur:
             del ucur
 
+    profiling.Stage("cleanup")
     for data in ["nearmatrix", "origins", nearmatrix, sumstats, minmaxstats, pivot]:
         arcpy.management.Delete(data)
 
+# Same outputs as GravityModel, computed as a dense matrix in NumPy instead of near table joins
+def GravityModelNumPy(in_dest, name_field, attr_field, in_orig, out_fc, tile_size=None, workers=1, cache_dir=None, method="PLANAR", decay_spec=None):
+    arcpy.env.overwriteOutput = True
+
+    # Read coordinates (centroids for polygons) and attributes once, both layers in the origins'
+    # coordinate system as GenerateNearTable measures them, or its longitude/latitude for the
+    # geodesic methods
+    profiling.Stage("read")
+    orig_oid = arcpy.Describe(in_orig).OIDFieldName
+    spatial_reference = arcpy.Describe(in_orig).spatialReference
+    read_reference = spatial_reference.GCS if method.upper() != "PLANAR" else spatial_reference
+    orig = arcpy.da.FeatureClassToNumPyArray(in_orig, ["OID@", "SHAPE@XY"], spatial_reference=read_reference)
+    dest = arcpy.da.FeatureClassToNumPyArray(in_dest, ["SHAPE@XY", name_field, attr_field], null_value={attr_field: 0}, spatial_reference=read_reference)
+    profiling.Rows(len(orig) + len(dest))
+    if not len(dest):
+        arcpy.AddError("Input destinations have no features.")
+        sys.exit()
+
+    # Reuse the distance matrix of an earlier run on the same origins and destinations, computed
+    # once tile by tile and read memory-mapped
+    dist = None
+    if cache_dir:
+        profiling.Stage("distances", len(orig) * len(dest))
+        dist = distcache.DistanceMatrix(orig["SHAPE@XY"], dest["SHAPE@XY"], cache_dir, spatial_reference.exportToString(), method.upper(), tile_size)
+
+    # Origins are streamed in tiles so only tile_size x destinations distances are held at once,
+    # the tiles are shared out over the worker processes
+    profiling.Stage("huff", len(orig) * len(dest))
+    decay_function = decay.Decay(decay_spec) if decay_spec else None
+    result = parallel.HuffModel(orig["SHAPE@XY"], dest["SHAPE@XY"], dest[attr_field], tile_size, arcpy.AddMessage, workers, dist, decay_function, method.upper())
+
+    # Copy the origins geometry with only the IN_FID field, as the pivoted output does
+    profiling.Stage("output", len(orig))
+    fieldmappings = MakeFieldMappings(in_orig, orig_oid)
+    arcpy.conversion.FeatureClassToFeatureClass(in_orig, os.path.dirname(out_fc), os.path.basename(out_fc), "", fieldmappings)
+
+    # Destination names become the probability fields, then write them all in one pass
+    profiling.Stage("write", len(orig))
+    names = [str(name) for name in dest[name_field]]
+    fields = UniqueFieldNames(names, os.path.dirname(out_fc))
+    # Origins no destination reaches (high_dest -1) take the empty name at the end
+    high_dest = np.array(names + [""], dtype=object)[result.high_dest]
+    probs = np.empty(len(orig), dtype=[("IN_FID", "<i4")] + [(field, "<f8") for field in fields] + [("HIGH_DEST", "<U%d" % max([len(name) for name in names] + [1]))])
+    probs["IN_FID"] = orig["OID@"]
+    for i, field in enumerate(fields):
+        probs[field] = result.prob[:, i]
+    probs["HIGH_DEST"] = high_dest
+    arcpy.da.ExtendTable(out_fc, "IN_FID", probs, "IN_FID", False)
+
+def UniqueFieldNames(names, workspace):
+    # One valid field per destination. Stores sharing a name (several shops of one chain) get
+    # _1, _2 ... suffixes, shortened where the workspace limits the field name length
+    used = {"IN_FID", "HIGH_DEST"}
+    fields = []
+    for name in names:
+        field = candidate = arcpy.ValidateFieldName(name, workspace)
+        suffix = 1
+        while candidate.upper() in used:
+            tagged = f"{field}_{suffix}"
+            candidate = arcpy.ValidateFieldName(tagged, workspace)
+            if candidate != tagged:
+                candidate = arcpy.ValidateFieldName(f"{field[:len(candidate) - len(str(suffix)) - 1]}_{suffix}", workspace)
+            suffix += 1
+        used.add(candidate.upper())
+        fields.append(candidate)
+    return fields
+
+def MakeFieldMappings(fc, fid_field):
+    fieldmappings = arcpy.FieldMappings()
+    in_fid_fieldmap = arcpy.FieldMap()
+    in_fid_fieldmap.addInputField(fc, fid_field)
+    in_fid_field = in_fid_fieldmap.outputField
+    in_fid_field.name = 'IN_FID'
+    in_fid_field.aliasName = 'IN_FID'
+    in_fid_fieldmap.outputField = in_fid_field
+    fieldmappings.addFieldMap(in_fid_fieldmap)
+    return fieldmappings
+
 # Run the script
 if __name__ == '__main__':
     # Get Parameters
@@ -137,6 +248,14 @@ if __name__ == '__main__':
     attr_field = arcpy.GetParameterAsText(2)
     in_orig = arcpy.GetParameterAsText(3)
     out_fc = arcpy.GetParameterAsText(4)
+    engine = arcpy.GetParameterAsText(5) if arcpy.GetArgumentCount() > 5 else ""
+    tile_size = arcpy.GetParameterAsText(6) if arcpy.GetArgumentCount() > 6 else ""
+    workers = arcpy.GetParameterAsText(7) if arcpy.GetArgumentCount() > 7 else ""
+    cache_dir = arcpy.GetParameterAsText(8) if arcpy.GetArgumentCount() > 8 else ""
+    method = arcpy.GetParameterAsText(9) if arcpy.GetArgumentCount() > 9 else ""
+    decay_spec = arcpy.GetParameterAsText(10) if arcpy.GetArgumentCount() > 10 else ""
+    profile_path = arcpy.GetParameterAsText(11) if arcpy.GetArgumentCount() > 11 else ""
 
     # Run the main script
-    GravityModel(in_dest, name_field, attr_field, in_orig, out_fc)
\ No newline at end of file
+    with profiling.Profile("GravityModel", profile_path or None, gpprofiling.WorkspaceRows):
+        GravityModel(in_dest, name_field, attr_field, in_orig, out_fc, engine or "GEOPROCESSING", int(tile_size) if tile_size else None, int(workers) if workers else 1, cache_dir or None, method or "PLANAR", decay_spec or None)
\ No newline at end of file
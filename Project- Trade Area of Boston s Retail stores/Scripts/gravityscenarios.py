@@ -0,0 +1,77 @@
+'''----------------------------------------------------------------------------------
+ Tool Name:   Gravity Model Scenarios
+ Toolbox:     TradeAreaTools.pyt
+ Source Name: gravityscenarios.py
+ Version:     ArcGIS 10.0
+ Author:      ESRI, Inc.
+ Required Arguments:
+              Input Destinations (Feature Layer)
+              Destination Name Field (Field)
+              Destination Attractiveness Field (Field)
+              Input Origins (Features Layer)
+              Input Candidate Sites (Feature Layer): same name and attractiveness fields as the destinations
+              Output Table (Table)
+ Optional Arguments:
+              Evaluate Closures (Boolean): also evaluate closing each existing destination (default false)
+              Origin Weight Field (Field): weight of each origin in the captured share, e.g. population
+              Distance Cache Folder (Folder): reuse the base distance matrix between runs
+              Distance Method (String): PLANAR (default), HAVERSINE or GEODESIC (ellipsoidal)
+              Distance Decay (String): decay function and parameters, EXPONENTIAL 2 (default) (decay.py)
+
+ Description: Evaluates candidate store openings (and optionally closures) against the Gravity Model in one run.
+              Each scenario reports the share of the origins captured by the new store, the share the closed
+              store held and the origins whose HIGH_DEST changes, ranked by captured share.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import arcpy
+
+import decay
+import distcache
+import scenarios
+
+# Main function, all functions run in GravityScenarios
+def GravityScenarios(in_dest, name_field, attr_field, in_orig, in_candidates, out_table, closures=False, weight_field=None, cache_dir=None, method="PLANAR", decay_spec=None):
+    arcpy.env.overwriteOutput = True
+
+    # Read coordinates (centroids for polygons) and attributes once, every layer in the origins'
+    # coordinate system, or its longitude/latitude for the geodesic methods
+    method = method.upper()
+    spatial_reference = arcpy.Describe(in_orig).spatialReference
+    read_reference = spatial_reference.GCS if method != "PLANAR" else spatial_reference
+    orig = arcpy.da.FeatureClassToNumPyArray(in_orig, ["SHAPE@XY"] + ([weight_field] if weight_field else []), null_value={weight_field: 0} if weight_field else None, spatial_reference=read_reference)
+    dest = arcpy.da.FeatureClassToNumPyArray(in_dest, ["SHAPE@XY", name_field, attr_field], null_value={attr_field: 0}, spatial_reference=read_reference)
+    candidates = arcpy.da.FeatureClassToNumPyArray(in_candidates, ["SHAPE@XY", name_field, attr_field], null_value={attr_field: 0}, spatial_reference=read_reference)
+
+    # One scenario per candidate site, and per existing destination when closures are evaluated
+    sweep = [scenarios.Scenario("ADD %s" % name, [(xy[0], xy[1], value)], []) for xy, name, value in candidates]
+    if closures:
+        sweep += [scenarios.Scenario("CLOSE %s" % name, [], [i]) for i, name in enumerate(dest[name_field])]
+
+    # The base matrix is shared by every scenario
+    dist = None
+    if cache_dir:
+        dist = distcache.DistanceMatrix(orig["SHAPE@XY"], dest["SHAPE@XY"], cache_dir, spatial_reference.exportToString(), method)
+
+    decay_function = decay.Decay(decay_spec) if decay_spec else None
+    summary = scenarios.EvaluateScenarios(orig["SHAPE@XY"], dest["SHAPE@XY"], dest[attr_field], sweep, orig[weight_field] if weight_field else None, dist, method, decay_function)
+    arcpy.AddMessage("Evaluated %d scenarios" % len(summary))
+    arcpy.da.NumPyArrayToTable(summary, out_table)
+
+# Run the script
+if __name__ == '__main__':
+    # Get Parameters
+    in_dest = arcpy.GetParameterAsText(0)
+    name_field = arcpy.GetParameterAsText(1)
+    attr_field = arcpy.GetParameterAsText(2)
+    in_orig = arcpy.GetParameterAsText(3)
+    in_candidates = arcpy.GetParameterAsText(4)
+    out_table = arcpy.GetParameterAsText(5)
+    closures = arcpy.GetParameterAsText(6) if arcpy.GetArgumentCount() > 6 else ""
+    weight_field = arcpy.GetParameterAsText(7) if arcpy.GetArgumentCount() > 7 else ""
+    cache_dir = arcpy.GetParameterAsText(8) if arcpy.GetArgumentCount() > 8 else ""
+    method = arcpy.GetParameterAsText(9) if arcpy.GetArgumentCount() > 9 else ""
+    decay_spec = arcpy.GetParameterAsText(10) if arcpy.GetArgumentCount() > 10 else ""
+
+    # Run the main script
+    GravityScenarios(in_dest, name_field, attr_field, in_orig, in_candidates, out_table, closures.lower() == "true", weight_field or None, cache_dir or None, method or "PLANAR", decay_spec or None)
@@ -0,0 +1,203 @@
+'''----------------------------------------------------------------------------------
+ Source Name: headless.py
+ Description: Runs the NUMPY engine of GravityModel (gravity.py), Gravity
+              (calcgravityinteractionscore.py) and WeightedCentralityScore
+              (CalculateWeightedSpatialCentralityIndex.py) on shapefiles without arcpy, e.g. on a
+              Linux server. Inputs are read and outputs written through shapefile.py; the outputs
+              have the fields the tools write, cut to 10 character dBASE names as in a shapefile
+              written by the tool (MAX_PROB_IN_FID becomes MAX_PROB_I).
+
+              Shapefiles are not reprojected: the geodesic methods need a geographic (.prj
+              GEOGCS) input, and distances and radii are in map units (PLANAR) or meters.
+
+ Usage:       python headless.py gravitymodel dest.shp NAME ATTR orig.shp out.shp [options]
+              python headless.py gravity dest.shp ATTR out.shp [--neighbors K] [--radius R] [options]
+              python headless.py centrality dest.shp ATTR out.shp [--neighbors K] [options]
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import argparse
+import sys
+
+import numpy as np
+
+import decay
+import distcache
+import geodesic
+import parallel
+import profiling
+import shapefile
+import tradearea
+
+
+def Coordinates(path, method, deleted):
+    # Centroids of a shapefile without its deleted records, checked to be longitude/latitude for
+    # the geodesic methods
+    if method != "PLANAR" and not shapefile.IsGeographic(path):
+        raise ValueError(f"{path} is not in a geographic coordinate system, {method} distances need longitude/latitude")
+    return shapefile.ReadCentroids(path, deleted)
+
+
+def CachedDistances(orig_xy, dest_xy, path, method, cache_dir, tile_size):
+    # Distance matrix through distcache when a cache folder is given, else the tiles compute their own
+    if not cache_dir:
+        return None
+    return distcache.DistanceMatrix(orig_xy, dest_xy, cache_dir, shapefile.SpatialReference(path), method, tile_size)
+
+
+def ToolColumns(table, scores):
+    # Input fields followed by the scores under the tool's field names, shortened to dBASE names
+    names = shapefile.FieldNames(list(table) + list(scores))
+    return dict(zip(names, list(table.values()) + list(scores.values())))
+
+
+def Attribute(table, field):
+    # Numeric field with nulls as 0, as the tools read it
+    values = np.asarray(table[field], dtype="f8")
+    return np.where(np.isnan(values), 0, values)
+
+
+def GravityModel(in_dest, name_field, attr_field, in_orig, out_fc, tile_size=None, workers=1, cache_dir=None, method="PLANAR", decay_spec=None, progress=print):
+    method = method.upper()
+    if not shapefile.SameSpatialReference(in_orig, in_dest):
+        raise ValueError(f"{in_orig} and {in_dest} have different spatial references, project one of them first")
+    profiling.Stage("read")
+    dest, dest_deleted = shapefile.ReadTable(in_dest, [name_field, attr_field])
+    _, orig_deleted = shapefile.ReadTable(in_orig, [])
+    orig_xy = Coordinates(in_orig, method, orig_deleted)
+    dest_xy = Coordinates(in_dest, method, dest_deleted)
+    profiling.Rows(len(orig_xy) + len(dest_xy))
+
+    profiling.Stage("distances", len(orig_xy) * len(dest_xy))
+    dist = CachedDistances(orig_xy, dest_xy, in_orig, method, cache_dir, tile_size)
+    profiling.Stage("huff", len(orig_xy) * len(dest_xy))
+    decay_function = decay.Decay(decay_spec) if decay_spec else None
+    result = parallel.HuffModel(orig_xy, dest_xy, Attribute(dest, attr_field), tile_size, progress, workers, dist, decay_function, method)
+
+    # IN_FID, one probability field per destination name and HIGH_DEST
+    profiling.Stage("write", len(orig_xy))
+    names = [str(name) for name in dest[name_field]]
+    columns = {"IN_FID": np.flatnonzero(~orig_deleted)}
+    for i, field in enumerate(shapefile.FieldNames(["IN_FID"] + names)[1:]):
+        columns[field] = result.prob[:, i]
+    # Origins no destination reaches (high_dest -1) take the empty name at the end
+    columns["HIGH_DEST"] = np.array(names + [""], dtype=str)[result.high_dest]
+    shapefile.CopyShapefile(in_orig, out_fc, columns, deleted=orig_deleted)
+
+
+def Gravity(in_dest, attr_field, out_fc, num_neighbors=None, radius=None, tile_size=None, workers=1, cache_dir=None, method="PLANAR", decay_spec=None, progress=print):
+    method = method.upper()
+    profiling.Stage("read")
+    table, deleted = shapefile.ReadTable(in_dest)
+    xy = Coordinates(in_dest, method, deleted)
+    attr = Attribute(table, attr_field)
+    profiling.Rows(len(xy))
+
+    profiling.Stage("distances")
+    dist = graph = None
+    if cache_dir and (num_neighbors or radius):
+        graph = distcache.SelfNeighbors(xy, num_neighbors, radius, cache_dir, shapefile.SpatialReference(in_dest), method)
+    elif cache_dir:
+        dist = distcache.DistanceMatrix(xy, xy, cache_dir, shapefile.SpatialReference(in_dest), method, tile_size)
+
+    # Rows are the pairs scored: the whole matrix, or the cached neighbor graph
+    pairs = len(graph.indices) if graph is not None else len(xy) * len(xy)
+    profiling.Stage("interaction", None if (num_neighbors or radius) and graph is None else pairs)
+    decay_function = decay.Decay(decay_spec, 1.0) if decay_spec else None
+    result = parallel.GravityInteraction(xy, attr, tile_size, progress, num_neighbors, radius, workers, dist, graph, decay_function, method)
+
+    # Input fields plus the scores
+    profiling.Stage("write", len(xy))
+    fid = np.flatnonzero(~deleted)
+    columns = ToolColumns(table, {"IN_FID": fid, "GRAVITY_INDEX": result.gravity_index,
+                                  f"{attr_field}_NET_MOVEMENT": result.net_movement, "MAX_PROB_IN_FID": fid[result.max_prob]})
+    shapefile.CopyShapefile(in_dest, out_fc, columns, shapefile.Encoding(in_dest), deleted)
+
+
+def WeightedCentralityScore(in_dest, attr_field, out_fc, num_neighbors=None, tile_size=None, cache_dir=None, method="GEODESIC", progress=print):
+    method = method.upper()
+    profiling.Stage("read")
+    table, deleted = shapefile.ReadTable(in_dest)
+    xy = Coordinates(in_dest, method, deleted)
+    attr = Attribute(table, attr_field)
+    n = len(xy)
+    profiling.Rows(n)
+
+    # Sum of distances to all other features, or to the num_neighbors nearest
+    profiling.Stage("sum_distances", n * (num_neighbors or n))
+    dist = graph = None
+    if cache_dir and num_neighbors and num_neighbors < n - 1:
+        graph = distcache.SelfNeighbors(xy, num_neighbors, None, cache_dir, shapefile.SpatialReference(in_dest), method)
+    elif cache_dir:
+        dist = distcache.DistanceMatrix(xy, xy, cache_dir, shapefile.SpatialReference(in_dest), method, tile_size)
+    sum_dist = tradearea.SumDistances(xy, num_neighbors, tile_size, progress, dist, graph, method)
+
+    # Distance to the weighted mean center, as Mean Center computes it
+    profiling.Stage("index", n)
+    center = (xy * attr[:, None]).sum(axis=0) / attr.sum()
+    if method == "PLANAR":
+        center_dist = np.hypot(*(xy - center).T)
+    else:
+        center_dist = geodesic.Distances(xy, center, method)
+
+    stats = tradearea.CentralityStatistics(zip(attr, sum_dist, center_dist))
+    profiling.Stage("write", n)
+    columns = ToolColumns(table, {"IN_FID": np.flatnonzero(~deleted), "SUM_DIST": sum_dist, "WEIGHTED_CENTER_DIST": center_dist,
+                                  "INTERACTION_INDEX": tradearea.CentralityIndex(attr, sum_dist, center_dist, stats)})
+    shapefile.CopyShapefile(in_dest, out_fc, columns, shapefile.Encoding(in_dest), deleted)
+
+
+def Arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Trade area tools on shapefiles without arcpy")
+    tools = parser.add_subparsers(dest="tool", required=True)
+
+    def Common(tool):
+        tool.add_argument("--tile-size", type=int)
+        tool.add_argument("--cache-dir")
+        tool.add_argument("--method", default=None, choices=geodesic.METHODS)
+        tool.add_argument("--profile", help="stage timings as JSON lines, or a .json profile dump")
+        return tool
+
+    model = Common(tools.add_parser("gravitymodel", help="Huff model probabilities (GravityModel)"))
+    model.add_argument("in_dest")
+    model.add_argument("name_field")
+    model.add_argument("attr_field")
+    model.add_argument("in_orig")
+    model.add_argument("out_fc")
+    model.add_argument("--workers", type=int, default=1)
+    model.add_argument("--decay")
+
+    gravity = Common(tools.add_parser("gravity", help="Spatial interaction scores (Gravity)"))
+    gravity.add_argument("in_dest")
+    gravity.add_argument("attr_field")
+    gravity.add_argument("out_fc")
+    gravity.add_argument("--neighbors", type=int)
+    gravity.add_argument("--radius", type=float)
+    gravity.add_argument("--workers", type=int, default=1)
+    gravity.add_argument("--decay")
+
+    centrality = Common(tools.add_parser("centrality", help="Weighted spatial centrality index (WeightedCentralityScore)"))
+    centrality.add_argument("in_dest")
+    centrality.add_argument("attr_field")
+    centrality.add_argument("out_fc")
+    centrality.add_argument("--neighbors", type=int)
+    return parser.parse_args(argv)
+
+
+# Run the script
+if __name__ == '__main__':
+    args = Arguments()
+    tools = {"gravitymodel": "GravityModel", "gravity": "Gravity", "centrality": "WeightedCentralityScore"}
+    try:
+        with profiling.Profile(tools[args.tool], args.profile):
+            if args.tool == "gravitymodel":
+                GravityModel(args.in_dest, args.name_field, args.attr_field, args.in_orig, args.out_fc, args.tile_size, args.workers,
+                             args.cache_dir, args.method or "PLANAR", args.decay)
+            elif args.tool == "gravity":
+                Gravity(args.in_dest, args.attr_field, args.out_fc, args.neighbors, args.radius, args.tile_size, args.workers,
+                        args.cache_dir, args.method or "PLANAR", args.decay)
+            else:
+                WeightedCentralityScore(args.in_dest, args.attr_field, args.out_fc, args.neighbors, args.tile_size, args.cache_dir,
+                                        args.method or "GEODESIC")
+    except (OSError, KeyError, ValueError) as error:
+        sys.exit(f"ERROR: {error}")
@@ -0,0 +1,105 @@
+'''----------------------------------------------------------------------------------
+ Tool Name:   Calibrate Gravity Model
+ Toolbox:     TradeAreaTools.pyt
+ Source Name: huffcalibration.py
+ Version:     ArcGIS 10.0
+ Author:      ESRI, Inc.
+ Required Arguments:
+              Input Destinations (Feature Layer)
+              Destination Attractiveness Field (Field)
+              Input Origins (Features Layer)
+              Visit Table (Table View): one row per origin and destination with observed visits
+              Visit Origin Field (Field): ObjectID of the origin
+              Visit Destination Field (Field): ObjectID of the destination (store names repeat
+              across the shops of a chain)
+              Visit Count Field (Field)
+              Output Table (Table)
+ Optional Arguments:
+              Distance Decay (String): EXPONENTIAL (default), POWER or GAUSSIAN
+              Calibration Method (String): MLE (default) or LEAST_SQUARES
+              Distance Method (String): PLANAR (default), HAVERSINE or GEODESIC (ellipsoidal)
+              Distance Cache Folder (Folder): reuse the distance matrix between runs
+              Fit Attractiveness Exponent (Boolean): also fit alpha in attractiveness ^ alpha, off by default
+
+ Description: Fits the distance decay parameter of the Gravity Model to observed visits. The Gravity Model weights
+              destinations by their attractiveness as is (alpha 1), so by default alpha is held at 1 and the
+              fitted decay can be passed as the Distance Decay of the Gravity Model NUMPY engine. With alpha
+              fitted as well, the decay only describes the visits together with that alpha.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import arcpy
+
+import numpy as np
+
+import calibration
+import distcache
+import tradearea
+
+# Main function, all functions run in CalibrateGravityModel
+def CalibrateGravityModel(in_dest, attr_field, in_orig, visit_table, visit_orig_field, visit_dest_field, visit_count_field,
+                          out_table, decay_name="EXPONENTIAL", method="MLE", distance_method="PLANAR", cache_dir=None, fit_alpha=False):
+    arcpy.env.overwriteOutput = True
+
+    # Read coordinates (centroids for polygons) and attributes once, both layers in the origins'
+    # coordinate system, or its longitude/latitude for the geodesic methods
+    distance_method = distance_method.upper()
+    spatial_reference = arcpy.Describe(in_orig).spatialReference
+    read_reference = spatial_reference.GCS if distance_method != "PLANAR" else spatial_reference
+    orig = arcpy.da.FeatureClassToNumPyArray(in_orig, ["OID@", "SHAPE@XY"], spatial_reference=read_reference)
+    dest = arcpy.da.FeatureClassToNumPyArray(in_dest, ["OID@", "SHAPE@XY", attr_field], null_value={attr_field: 0}, spatial_reference=read_reference)
+
+    # Observed visits as an origins x destinations matrix, both keyed on ObjectID
+    table = arcpy.da.TableToNumPyArray(visit_table, [visit_orig_field, visit_dest_field, visit_count_field], null_value={visit_count_field: 0})
+    orig_index = {oid: i for i, oid in enumerate(orig["OID@"])}
+    dest_index = {oid: i for i, oid in enumerate(dest["OID@"])}
+    known = np.array([orig_oid in orig_index and dest_oid in dest_index for orig_oid, dest_oid in zip(table[visit_orig_field], table[visit_dest_field])], dtype=bool)
+    if not known.all():
+        arcpy.AddWarning("%d visit rows match no origin or destination and were skipped" % (~known).sum())
+    table = table[known]
+    visits = calibration.VisitMatrix([orig_index[oid] for oid in table[visit_orig_field]], [dest_index[oid] for oid in table[visit_dest_field]],
+                                     table[visit_count_field], len(orig), len(dest))
+
+    # One distance matrix, rescaled to 0-10 as the Gravity Model does, serves every iteration
+    if cache_dir:
+        dist = distcache.DistanceMatrix(orig["SHAPE@XY"], dest["SHAPE@XY"], cache_dir, spatial_reference.exportToString(), distance_method)
+    else:
+        dist = tradearea.DistanceMatrix(orig["SHAPE@XY"], dest["SHAPE@XY"], distance_method)
+    dist = tradearea.RescaleDistances(dist, dist.min(), dist.max())
+
+    # The rescaled distances start at 0, the power decay is fitted on d + 1
+    offset = 1.0 if decay_name.upper() == "POWER" else 0.0
+    result = calibration.Calibrate(dist, dest[attr_field], visits, decay_name, method, offset, progress=arcpy.AddMessage,
+                                   alpha=None if fit_alpha else 1.0)
+    if not result.converged:
+        arcpy.AddWarning("Calibration did not converge in %d iterations" % result.iterations)
+    if fit_alpha:
+        arcpy.AddWarning("The decay was fitted with alpha %.6g, the Gravity Model applies alpha 1" % result.alpha)
+    arcpy.AddMessage("Attractiveness exponent %.6g, distance decay %s, %.1f ms per iteration" % (result.alpha, result.decay_spec, 1000 * np.mean(result.times)))
+
+    fitted = np.array([(result.alpha, result.beta, result.decay_spec, result.objective, result.iterations, int(result.converged), 1000 * np.mean(result.times))],
+                      dtype=[("ALPHA", "<f8"), ("BETA", "<f8"), ("DECAY", "<U64"), ("OBJECTIVE", "<f8"), ("ITERATIONS", "<i4"),
+                             ("CONVERGED", "<i2"), ("MS_PER_ITERATION", "<f8")])
+    arcpy.da.NumPyArrayToTable(fitted, out_table)
+
+# Run the script
+if __name__ == '__main__':
+    # Get Parameters
+    in_dest = arcpy.GetParameterAsText(0)
+    attr_field = arcpy.GetParameterAsText(1)
+    in_orig = arcpy.GetParameterAsText(2)
+    visit_table = arcpy.GetParameterAsText(3)
+    visit_orig_field = arcpy.GetParameterAsText(4)
+    visit_dest_field = arcpy.GetParameterAsText(5)
+    visit_count_field = arcpy.GetParameterAsText(6)
+    out_table = arcpy.GetParameterAsText(7)
+    decay_name = arcpy.GetParameterAsText(8) if arcpy.GetArgumentCount() > 8 else ""
+    method = arcpy.GetParameterAsText(9) if arcpy.GetArgumentCount() > 9 else ""
+    distance_method = arcpy.GetParameterAsText(10) if arcpy.GetArgumentCount() > 10 else ""
+    cache_dir = arcpy.GetParameterAsText(11) if arcpy.GetArgumentCount() > 11 else ""
+    fit_alpha = arcpy.GetParameterAsText(12) if arcpy.GetArgumentCount() > 12 else ""
+
+    # Run the main script
+    CalibrateGravityModel(in_dest, attr_field, in_orig, visit_table, visit_orig_field, visit_dest_field, visit_count_field,
+                          out_table, decay_name or "EXPONENTIAL", method or "MLE", distance_method or "PLANAR", cache_dir or None,
+                          fit_alpha.lower() == "true")
@@ -0,0 +1,248 @@
+'''----------------------------------------------------------------------------------
+ Source Name: incremental.py
+ Description: Incremental re-scoring for the Huff model (GravityModel) and the spatial
+              interaction scores (Gravity) when a few destinations are inserted, deleted or
+              re-weighted. The state keeps the distance decay of every pair (kernel), so a change
+              to one destination only touches its column: the per origin sums (SUM_num /
+              SUM_X_INVDIST) and the argmax are adjusted instead of rebuilt.
+
+              Destinations live in slots. Deleted slots are reused by later inserts and the
+              arrays grow by doubling, so slot numbers stay stable for the caller. The state
+              arrays are updated in place. When a change moves the distance range used for
+              rescaling, every kernel value changes and the state is rebuilt from scratch.
+
+              The state keeps its distance method: PLANAR, or HAVERSINE / GEODESIC on
+              longitude/latitude coordinates, as in tradearea.DistanceMatrix.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+from collections import namedtuple
+
+import numpy as np
+
+import decay
+import tradearea
+
+# kernel is origins x slots decay(rescaled distance), exp(-2 * d) by default; num = kernel * attr; sum_num per origin
+HuffState = namedtuple("HuffState", ["orig_xy", "dest_xy", "attr", "active", "kernel", "sum_num", "high_dest",
+                                     "min_dist", "max_dist", "col_min", "col_max", "decay_function", "method"])
+
+# kernel is slots x slots decay(rescale(distance, 0, max, 1, 10)), 1 / d by default; sum_weighted per feature (SUM_X_INVDIST)
+InteractionState = namedtuple("InteractionState", ["xy", "attr", "active", "kernel", "sum_weighted", "max_prob",
+                                                   "max_dist", "row_max", "decay_function", "method"])
+
+
+def HuffKernel(dist, min_dist, max_dist, decay_function=None):
+    return (decay_function or decay.HUFF_DECAY)(tradearea.RescaleDistances(dist, min_dist, max_dist))
+
+
+def InteractionKernel(dist, max_dist, decay_function=None):
+    return (decay_function or decay.INTERACTION_DECAY)(tradearea.rescale(dist, 0, max_dist, 1, 10))
+
+
+def RowArgmax(kernel, attr, rows):
+    # Destination with the highest numerator for the given origin rows
+    return (kernel[rows] * attr[None, :]).argmax(axis=1)
+
+
+def UpdateArgmax(best, kernel, attr, slot, old_attr, rows=None):
+    # Keep best (argmax of kernel * attr per row) current after attr[slot] changed from old_attr.
+    # A higher value can only win rows, a lower one only needs the rows it was winning redone
+    rows = np.arange(len(best)) if rows is None else rows
+    if attr[slot] >= old_attr:
+        column = kernel[rows, slot] * attr[slot]
+        current = kernel[rows, best[rows]] * attr[best[rows]]
+        best[rows[column > current]] = slot
+    else:
+        lost = rows[best[rows] == slot]
+        best[lost] = RowArgmax(kernel, attr, lost)
+
+
+def FreeSlot(active):
+    free = np.flatnonzero(~active)
+    return int(free[0]) if len(free) else None
+
+
+def Grow(array, size, axes):
+    # Copy array into a zero padded one with size slots along axes
+    shape = list(array.shape)
+    for axis in axes:
+        shape[axis] = size
+    grown = np.zeros(shape, dtype=array.dtype)
+    grown[tuple(slice(0, n) for n in array.shape)] = array
+    return grown
+
+
+# Huff model (GravityModel)
+
+def HuffStart(orig_xy, dest_xy, attr, decay_function=None, method="PLANAR"):
+    # Full run that keeps the state needed for incremental updates
+    orig_xy = np.asarray(orig_xy, dtype="f8").reshape(-1, 2)
+    dest_xy = np.array(dest_xy, dtype="f8").reshape(-1, 2)
+    attr = np.array(attr, dtype="f8")
+    dist = tradearea.DistanceMatrix(orig_xy, dest_xy, method)
+    col_min, col_max = dist.min(axis=0), dist.max(axis=0)
+    min_dist, max_dist = col_min.min(), col_max.max()
+    kernel = HuffKernel(dist, min_dist, max_dist, decay_function)
+    return HuffState(orig_xy, dest_xy, attr, np.ones(len(attr), dtype=bool), kernel, kernel @ attr,
+                     RowArgmax(kernel, attr, slice(None)), min_dist, max_dist, col_min, col_max, decay_function, method)
+
+
+def HuffRebuild(state):
+    # Recompute every active slot after the distance range changed
+    active = state.active
+    dist = tradearea.DistanceMatrix(state.orig_xy, state.dest_xy[active], state.method)
+    col_min, col_max = state.col_min.copy(), state.col_max.copy()
+    col_min[active], col_max[active] = dist.min(axis=0), dist.max(axis=0)
+    min_dist, max_dist = col_min[active].min(), col_max[active].max()
+    kernel = np.zeros_like(state.kernel)
+    kernel[:, active] = HuffKernel(dist, min_dist, max_dist, state.decay_function)
+    return state._replace(kernel=kernel, sum_num=kernel @ state.attr, high_dest=RowArgmax(kernel, state.attr, slice(None)),
+                          min_dist=min_dist, max_dist=max_dist, col_min=col_min, col_max=col_max)
+
+
+def HuffUpdate(state, inserts=(), deletes=(), edits=()):
+    # Apply a delta of destinations: inserts [(x, y, attr)], deletes [slot], edits [(slot, attr)].
+    # Returns the new state and the slots given to the inserts
+    rebuild = False
+    slots = []
+    for x, y, value in inserts:
+        slot = FreeSlot(state.active)
+        if slot is None:
+            slot = len(state.active)
+            size = max(2 * slot, 1)
+            state = state._replace(dest_xy=Grow(state.dest_xy, size, [0]), attr=Grow(state.attr, size, [0]),
+                                   active=Grow(state.active, size, [0]), kernel=Grow(state.kernel, size, [1]),
+                                   col_min=Grow(state.col_min, size, [0]), col_max=Grow(state.col_max, size, [0]))
+        dist = tradearea.DistanceMatrix(state.orig_xy, [(x, y)], state.method)[:, 0]
+        state.dest_xy[slot] = (x, y)
+        state.col_min[slot], state.col_max[slot] = dist.min(), dist.max()
+        state.active[slot] = True
+        rebuild = rebuild or dist.min() < state.min_dist or dist.max() > state.max_dist
+        state.kernel[:, slot] = HuffKernel(dist, state.min_dist, state.max_dist, state.decay_function)
+        state.attr[slot] = 0
+        state = HuffEdit(state, slot, value)
+        slots.append(slot)
+
+    for slot in deletes:
+        state = HuffEdit(state, slot, 0)
+        state.active[slot] = False
+        state.kernel[:, slot] = 0
+        rebuild = rebuild or state.col_min[slot] <= state.min_dist or state.col_max[slot] >= state.max_dist
+
+    for slot, value in edits:
+        state = HuffEdit(state, slot, value)
+
+    if rebuild:
+        # Deletes only move the range when they held the min or max
+        active = state.active
+        if not active.any():
+            return state, slots
+        if (state.col_min[active].min(), state.col_max[active].max()) != (state.min_dist, state.max_dist):
+            state = HuffRebuild(state)
+    return state, slots
+
+
+def HuffEdit(state, slot, value):
+    # New attractiveness for one destination: only its column of numerators changes
+    old = state.attr[slot]
+    state.sum_num[:] += state.kernel[:, slot] * (value - old)
+    state.attr[slot] = value
+    UpdateArgmax(state.high_dest, state.kernel, state.attr, slot, old)
+    return state
+
+
+def HuffProbabilities(state):
+    # prob per origin and slot (inactive slots are 0), same as tradearea.HuffModel
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (state.kernel * state.attr[None, :]) / state.sum_num[:, None]
+
+
+# Spatial interaction (Gravity)
+
+def InteractionStart(xy, attr, decay_function=None, method="PLANAR"):
+    # Full run over all pairs (self pairs at distance 0) that keeps the state for updates
+    xy = np.array(xy, dtype="f8").reshape(-1, 2)
+    attr = np.array(attr, dtype="f8")
+    dist = tradearea.DistanceMatrix(xy, xy, method)
+    row_max = dist.max(axis=1)
+    max_dist = row_max.max()
+    kernel = InteractionKernel(dist, max_dist, decay_function)
+    return InteractionState(xy, attr, np.ones(len(attr), dtype=bool), kernel, kernel @ attr,
+                            RowArgmax(kernel, attr, slice(None)), max_dist, row_max, decay_function, method)
+
+
+def InteractionRebuild(state):
+    active = np.flatnonzero(state.active)
+    dist = tradearea.DistanceMatrix(state.xy[active], state.xy[active], state.method)
+    row_max = state.row_max.copy()
+    row_max[active] = dist.max(axis=1)
+    max_dist = row_max[active].max()
+    kernel = np.zeros_like(state.kernel)
+    kernel[np.ix_(active, active)] = InteractionKernel(dist, max_dist, state.decay_function)
+    max_prob = state.max_prob.copy()
+    max_prob[active] = RowArgmax(kernel, state.attr, active)
+    return state._replace(kernel=kernel, sum_weighted=kernel @ state.attr, max_prob=max_prob, max_dist=max_dist, row_max=row_max)
+
+
+def InteractionUpdate(state, inserts=(), deletes=(), edits=()):
+    # Same delta format as HuffUpdate. Every feature is both an origin and a destination, so an
+    # insert fills a row and a column of the kernel
+    rebuild = False
+    slots = []
+    for x, y, value in inserts:
+        slot = FreeSlot(state.active)
+        if slot is None:
+            slot = len(state.active)
+            size = max(2 * slot, 1)
+            state = state._replace(xy=Grow(state.xy, size, [0]), attr=Grow(state.attr, size, [0]),
+                                   active=Grow(state.active, size, [0]), kernel=Grow(state.kernel, size, [0, 1]),
+                                   sum_weighted=Grow(state.sum_weighted, size, [0]), max_prob=Grow(state.max_prob, size, [0]),
+                                   row_max=Grow(state.row_max, size, [0]))
+        state.xy[slot] = (x, y)
+        state.active[slot] = True
+        active = np.flatnonzero(state.active)
+        dist = tradearea.DistanceMatrix([(x, y)], state.xy[active], state.method)[0]
+        state.row_max[active] = np.maximum(state.row_max[active], dist)
+        state.row_max[slot] = dist.max()
+        rebuild = rebuild or dist.max() > state.max_dist
+        state.kernel[slot, active] = state.kernel[active, slot] = InteractionKernel(dist, state.max_dist, state.decay_function)
+
+        # The new row: its own sum and argmax over the existing features
+        state.attr[slot] = 0
+        state.sum_weighted[slot] = state.kernel[slot] @ state.attr
+        state.max_prob[slot] = RowArgmax(state.kernel, state.attr, [slot])[0]
+        state = InteractionEdit(state, slot, value)
+        slots.append(slot)
+
+    for slot in deletes:
+        state = InteractionEdit(state, slot, 0)
+        state.active[slot] = False
+        state.kernel[slot, :] = state.kernel[:, slot] = 0
+        state.sum_weighted[slot] = 0
+        rebuild = rebuild or state.row_max[slot] >= state.max_dist
+
+    for slot, value in edits:
+        state = InteractionEdit(state, slot, value)
+
+    if rebuild and state.active.any():
+        state = InteractionRebuild(state)
+    return state, slots
+
+
+def InteractionEdit(state, slot, value):
+    old = state.attr[slot]
+    state.sum_weighted[:] += state.kernel[:, slot] * (value - old)
+    state.attr[slot] = value
+    UpdateArgmax(state.max_prob, state.kernel, state.attr, slot, old, np.flatnonzero(state.active))
+    return state
+
+
+def InteractionScores(state):
+    # GRAVITY_INDEX, movement and _NET_MOVEMENT per slot, as tradearea.GravityInteraction.
+    # The column sums are one matrix-vector product over the kept kernel, no distances
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse_sum = np.where(state.active, 1 / state.sum_weighted, 0)
+    gravity_index = 100 * state.attr * (state.kernel.T @ inverse_sum)
+    movement = state.attr * (state.kernel.T @ (state.attr * inverse_sum))
+    return tradearea.InteractionResult(gravity_index, movement, tradearea.NetMovement(movement, state.attr), state.max_prob)
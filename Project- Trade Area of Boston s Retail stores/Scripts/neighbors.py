@@ -0,0 +1,201 @@
+'''----------------------------------------------------------------------------------
+ Source Name: neighbors.py
+ Description: Uniform grid spatial index over point (or centroid) coordinates. Answers radius
+              and k-nearest queries for a whole array of query points at once and returns the
+              result as CSR rows (indptr, indices, distances), the sparse form of a near table.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import math
+from collections import namedtuple
+
+import numpy as np
+
+import geodesic
+
+# Points sorted by grid cell. starts[c]:starts[c + 1] are the positions in order of the points in cell c
+GridIndex = namedtuple("GridIndex", ["xy", "x0", "y0", "cell_size", "nx", "ny", "order", "starts"])
+
+# Near table in CSR form: row i holds indices[indptr[i]:indptr[i + 1]] sorted by distance
+NeighborGraph = namedtuple("NeighborGraph", ["indptr", "indices", "distances"])
+
+
+def BuildGridIndex(xy, cell_size=None, per_cell=1):
+    # Build the index once over the destination coordinates
+    xy = np.asarray(xy, dtype="f8").reshape(-1, 2)
+    n = len(xy)
+    x0, y0 = xy.min(axis=0) if n else (0.0, 0.0)
+    width, height = np.ptp(xy, axis=0) if n else (0.0, 0.0)
+
+    # Default to about per_cell points per cell, and keep the cell count in proportion to the points
+    if not cell_size:
+        cell_size = math.sqrt(max(width * height, 1e-12) * per_cell / max(n, 1))
+    cell_size = max(cell_size, math.sqrt(width * height / (4 * max(n, 1))), width / (4 * max(n, 1)), height / (4 * max(n, 1)), 1e-9)
+    nx = int(width // cell_size) + 1
+    ny = int(height // cell_size) + 1
+
+    cells = CellOf(xy, x0, y0, cell_size, nx, ny)
+    order = np.argsort(cells, kind="stable")
+    starts = np.zeros(nx * ny + 1, dtype="i8")
+    np.cumsum(np.bincount(cells, minlength=nx * ny), out=starts[1:])
+    return GridIndex(xy, x0, y0, cell_size, nx, ny, order, starts)
+
+
+def CellOf(xy, x0, y0, cell_size, nx, ny):
+    # Flat cell number, points outside the extent fall in the nearest edge cell
+    ix = np.clip(((xy[:, 0] - x0) // cell_size).astype("i8"), 0, nx - 1)
+    iy = np.clip(((xy[:, 1] - y0) // cell_size).astype("i8"), 0, ny - 1)
+    return ix * ny + iy
+
+
+def Candidates(index, query_xy, rows, reach):
+    # All (query row, point) pairs in the (2 * reach + 1)^2 block of cells around each query.
+    # Cells are numbered column by column, so each column of the block is one run of positions
+    ix = np.clip(((query_xy[rows, 0] - index.x0) // index.cell_size).astype("i8"), 0, index.nx - 1)
+    iy = np.clip(((query_xy[rows, 1] - index.y0) // index.cell_size).astype("i8"), 0, index.ny - 1)
+    y_first = np.maximum(iy - reach, 0)
+    y_last = np.minimum(iy + reach, index.ny - 1)
+    pair_rows, pair_points = [], []
+    for ox in range(max(-reach, -index.nx + 1), min(reach, index.nx - 1) + 1):
+        cx = ix + ox
+        valid = (cx >= 0) & (cx < index.nx)
+        start = index.starts[cx[valid] * index.ny + y_first[valid]]
+        count = index.starts[cx[valid] * index.ny + y_last[valid] + 1] - start
+        total = count.sum()
+        if not total:
+            continue
+        # Expand each [start, start + count) run into individual positions
+        offsets = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+        pair_rows.append(np.repeat(rows[valid], count))
+        pair_points.append(index.order[np.repeat(start, count) + offsets])
+    if not pair_rows:
+        return np.empty(0, dtype="i8"), np.empty(0, dtype="i8")
+    return np.concatenate(pair_rows), np.concatenate(pair_points)
+
+
+def ToGraph(n_rows, rows, points, dist, limit=None):
+    # Sort the pairs by row then distance and keep at most limit per row
+    order = np.lexsort((points, dist, rows))
+    rows, points, dist = rows[order], points[order], dist[order]
+    if limit is not None:
+        first = np.searchsorted(rows, rows, side="left")
+        keep = (np.arange(len(rows)) - first) < limit
+        rows, points, dist = rows[keep], points[keep], dist[keep]
+    indptr = np.zeros(n_rows + 1, dtype="i8")
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return NeighborGraph(indptr, points, dist)
+
+
+def PairDistances(index, query_xy, rows, points):
+    return np.hypot(query_xy[rows, 0] - index.xy[points, 0], query_xy[rows, 1] - index.xy[points, 1])
+
+
+def RadiusQuery(index, query_xy, radius):
+    # Every indexed point within radius of each query point
+    query_xy = np.asarray(query_xy, dtype="f8").reshape(-1, 2)
+    rows = np.arange(len(query_xy))
+    reach = max(int(math.ceil(radius / index.cell_size)), 1)
+    rows, points = Candidates(index, query_xy, rows, reach)
+    dist = PairDistances(index, query_xy, rows, points)
+    keep = dist <= radius
+    return ToGraph(len(query_xy), rows[keep], points[keep], dist[keep])
+
+
+def KNearestQuery(index, query_xy, k):
+    # The k nearest indexed points of each query point. Rings of cells grow until the k-th
+    # candidate is closer than the ring edge, so no nearer point can sit in an unvisited cell
+    query_xy = np.asarray(query_xy, dtype="f8").reshape(-1, 2)
+    n_rows = len(query_xy)
+    k = min(int(k), len(index.xy))
+    found_rows, found_points, found_dist = [], [], []
+    pending = np.arange(n_rows)
+    reach = 1
+    while len(pending) and k:
+        rows, points = Candidates(index, query_xy, pending, reach)
+        dist = PairDistances(index, query_xy, rows, points)
+        whole_grid = reach >= max(index.nx, index.ny)
+
+        # A row is done once k candidates lie inside the distance fully covered by the ring
+        covered = (dist <= reach * index.cell_size) | whole_grid
+        done = np.bincount(rows[covered], minlength=n_rows) >= k
+        keep = done[rows] & covered
+        found_rows.append(rows[keep])
+        found_points.append(points[keep])
+        found_dist.append(dist[keep])
+        pending = pending[~done[pending]]
+        reach *= 2
+    if not found_rows:
+        return ToGraph(n_rows, np.empty(0, dtype="i8"), np.empty(0, dtype="i8"), np.empty(0))
+    return ToGraph(n_rows, np.concatenate(found_rows), np.concatenate(found_points), np.concatenate(found_dist), k)
+
+
+def BoundedQuery(index, query_xy, bounds):
+    # Every indexed point within a distance bound of its own per query row. Rows are grouped by
+    # the ring reach they need, rounded up to a power of two to keep the groups few
+    query_xy = np.asarray(query_xy, dtype="f8").reshape(-1, 2)
+    steps = np.maximum(np.ceil(bounds / index.cell_size), 1)
+    reach = (2 ** np.ceil(np.log2(steps))).astype("i8")
+    found_rows, found_points = [np.empty(0, dtype="i8")], [np.empty(0, dtype="i8")]
+    for value in np.unique(reach):
+        rows, points = Candidates(index, query_xy, np.flatnonzero(reach == value), int(value))
+        keep = PairDistances(index, query_xy, rows, points) <= bounds[rows]
+        found_rows.append(rows[keep])
+        found_points.append(points[keep])
+    return np.concatenate(found_rows), np.concatenate(found_points)
+
+
+def GeodesicNeighbors(lonlat, num_neighbors=None, radius=None, method="GEODESIC"):
+    # Near table on longitude/latitude with geodesic distances in meters. The grid is built on a
+    # local projection and every search distance is widened by its distortion margin, so the
+    # result is the same as ranking all pairs geodesically
+    xy, margin = geodesic.LocalProjection(lonlat)
+    n = len(xy)
+    index = BuildGridIndex(xy, radius * margin if radius else None)
+    if radius:
+        graph = RadiusQuery(index, xy, radius * margin)
+        rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+        points = graph.indices
+    else:
+        # The geodesic distance to the k-th nearest on the projection bounds the true k-th, gather
+        # everything the projection puts inside that bound and rank it geodesically
+        graph = KNearestQuery(index, xy, int(num_neighbors) + 1)
+        rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+        bounds = np.zeros(n)
+        np.maximum.at(bounds, rows, geodesic.Distances(lonlat[rows], lonlat[graph.indices], method))
+        rows, points = BoundedQuery(index, xy, bounds * margin)
+    dist = geodesic.Distances(lonlat[rows], lonlat[points], method)
+    if radius:
+        keep = dist <= radius
+        rows, points, dist = rows[keep], points[keep], dist[keep]
+    return ToGraph(n, rows, points, dist)
+
+
+def SelfNeighbors(xy, num_neighbors=None, radius=None, method="PLANAR"):
+    # Near table of a layer against itself like GenerateNearTable(in_dest, in_dest, radius, num_neighbors)
+    # with each feature's self pair at distance 0 as the first entry of its row. Geodesic methods
+    # take longitude/latitude and a radius in meters
+    xy = np.asarray(xy, dtype="f8").reshape(-1, 2)
+    n = len(xy)
+    if method.upper() != "PLANAR":
+        graph = GeodesicNeighbors(xy, num_neighbors, radius, method)
+    elif radius:
+        graph = RadiusQuery(BuildGridIndex(xy, radius), xy, radius)
+    else:
+        graph = KNearestQuery(BuildGridIndex(xy), xy, int(num_neighbors) + 1)
+
+    rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+    others = graph.indices != rows
+    rows = np.concatenate([np.arange(n), rows[others]])
+    points = np.concatenate([np.arange(n), graph.indices[others]])
+    dist = np.concatenate([np.zeros(n), graph.distances[others]])
+
+    # Self pairs sort first at distance 0, keep them plus num_neighbors others
+    order = np.lexsort((points != rows, dist, rows))
+    rows, points, dist = rows[order], points[order], dist[order]
+    if num_neighbors:
+        first = np.searchsorted(rows, rows, side="left")
+        keep = (np.arange(len(rows)) - first) <= int(num_neighbors)
+        rows, points, dist = rows[keep], points[keep], dist[keep]
+    indptr = np.zeros(n + 1, dtype="i8")
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return NeighborGraph(indptr, points, dist)
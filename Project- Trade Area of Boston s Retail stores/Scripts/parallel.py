@@ -0,0 +1,192 @@
+'''----------------------------------------------------------------------------------
+ Source Name: parallel.py
+ Description: Process pool execution of the tradearea engine. Origins are sharded in tiles across
+              workers; the coordinate and attribute arrays and the outputs live in shared memory
+              so they are never pickled per task. Tile results are merged in tile order, and the
+              tiles are the ones a serial run uses, so the output is the same whatever order the
+              workers finish in and however many there are.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import tradearea
+
+# Arrays attached by each worker process, by name
+_arrays = {}
+_blocks = []
+
+# Pairs per tile when no tile size is given. The tiles do not depend on the worker count, so a
+# serial and a parallel run add the same tile sums in the same order and give identical results
+TILE_PAIRS = 2 ** 22
+
+
+def WorkerCount(workers=None):
+    # None or 0 means one worker per core
+    return int(workers) if workers else (os.cpu_count() or 1)
+
+
+def ShareArray(array, blocks):
+    # Copy an array into a new shared memory block and return what a worker needs to attach it
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(block)
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    return block.name, array.shape, array.dtype.str
+
+
+def SharedView(spec, blocks):
+    # The parent's view of a block created by ShareArray
+    name, shape, dtype = spec
+    block = next(block for block in blocks if block.name == name)
+    return np.ndarray(shape, dtype, buffer=block.buf)
+
+
+def ShareOrMap(array, blocks):
+    # Arrays already backed by a .npy file (distcache entries) are memory-mapped by path in the
+    # workers, anything else is copied to shared memory
+    if isinstance(array, np.memmap) and array.filename and array.filename.lower().endswith(".npy"):
+        return array.filename
+    return ShareArray(array, blocks)
+
+
+def AttachArrays(specs):
+    # Pool initializer, maps the shared blocks read-only (inputs) or writable (outputs)
+    for key, spec in specs.items():
+        if isinstance(spec, str):
+            _arrays[key] = np.load(spec, mmap_mode="r")
+            continue
+        name, shape, dtype = spec
+        block = shared_memory.SharedMemory(name=name)
+        _blocks.append(block)
+        _arrays[key] = np.ndarray(shape, dtype, buffer=block.buf)
+        if not key.startswith("out_"):
+            _arrays[key].flags.writeable = False
+
+
+def Pool(workers, specs):
+    # Geoprocessing tools run inside ArcGISPro.exe, workers have to be started with python.exe
+    if sys.platform == "win32" and not os.path.basename(sys.executable).lower().startswith("python"):
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe"))
+    return ProcessPoolExecutor(workers, multiprocessing.get_context("spawn"), AttachArrays, (specs,))
+
+
+def ShardSize(m, tile_size=None):
+    # Origins per tile: the given tile size, else about TILE_PAIRS pairs against m destinations
+    return int(tile_size) if tile_size else max(TILE_PAIRS // max(m, 1), 1)
+
+
+def Shards(n, m, tile_size=None):
+    return [(tile.start, tile.stop) for tile in tradearea.Tiles(n, ShardSize(m, tile_size))]
+
+
+def RangeTask(bounds, method="PLANAR"):
+    dist = tradearea.TileDistances(_arrays["orig_xy"], _arrays["dest_xy"], slice(*bounds), _arrays.get("dist"), method)
+    return dist.min(), dist.max()
+
+
+def HuffTask(bounds, min_dist, max_dist, decay_function=None, method="PLANAR"):
+    start = time.perf_counter()
+    tile = slice(*bounds)
+    result = tradearea.HuffTile(_arrays["orig_xy"], _arrays["dest_xy"], _arrays["attr"], tile, min_dist, max_dist, _arrays.get("dist"), decay_function, method)
+    _arrays["out_prob"][tile] = result.prob
+    _arrays["out_high_dest"][tile] = result.high_dest
+    _arrays["out_sum_num"][tile] = result.sum_num
+    return result.prob.size, time.perf_counter() - start
+
+
+def InteractionTask(bounds, max_dist, decay_function=None, method="PLANAR"):
+    start = time.perf_counter()
+    tile = slice(*bounds)
+    tile_index, tile_movement, _arrays["out_max_prob"][tile] = tradearea.InteractionTile(_arrays["orig_xy"], _arrays["attr"], tile, max_dist, _arrays.get("dist"), decay_function, method)
+    return tile_index, tile_movement, (tile.stop - tile.start) * len(_arrays["orig_xy"]), time.perf_counter() - start
+
+
+def HuffModel(orig_xy, dest_xy, attr, tile_size=None, progress=None, workers=None, dist=None, decay_function=None, method="PLANAR"):
+    # tradearea.HuffModel with origin tiles spread over a pool of worker processes. The decay
+    # function is pickled to the workers, so it has to be a decay.Decay partial or module level.
+    # Without a precomputed matrix every worker computes the distances of its own tiles
+    workers = WorkerCount(workers)
+    if workers <= 1:
+        return tradearea.HuffModel(orig_xy, dest_xy, attr, ShardSize(len(attr), tile_size), progress, dist, decay_function, method)
+    orig_xy = np.asarray(orig_xy, dtype="f8").reshape(-1, 2)
+    dest_xy = np.asarray(dest_xy, dtype="f8").reshape(-1, 2)
+    attr = np.asarray(attr, dtype="f8")
+    n, m = len(orig_xy), len(dest_xy)
+
+    blocks = []
+    try:
+        specs = {"orig_xy": ShareArray(orig_xy, blocks),
+                 "dest_xy": ShareArray(dest_xy, blocks),
+                 "attr": ShareArray(attr, blocks),
+                 "out_prob": ShareArray(np.empty((n, m)), blocks),
+                 "out_high_dest": ShareArray(np.empty(n, dtype="i8"), blocks),
+                 "out_sum_num": ShareArray(np.empty(n), blocks)}
+        if dist is not None:
+            specs["dist"] = ShareOrMap(dist, blocks)
+        shards = Shards(n, m, tile_size)
+        with Pool(workers, specs) as pool:
+            ranges = list(pool.map(RangeTask, shards, [method] * len(shards)))
+            min_dist = min(low for low, high in ranges)
+            max_dist = max(high for low, high in ranges)
+            tasks = pool.map(HuffTask, shards, [min_dist] * len(shards), [max_dist] * len(shards), [decay_function] * len(shards),
+                             [method] * len(shards))
+            for index, (pairs, elapsed) in enumerate(tasks, 1):
+                tradearea.ReportTile(progress, index, len(shards), pairs, elapsed)
+
+        return tradearea.HuffResult(SharedView(specs["out_prob"], blocks).copy(),
+                                    SharedView(specs["out_high_dest"], blocks).copy(),
+                                    SharedView(specs["out_sum_num"], blocks).copy())
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def GravityInteraction(xy, attr, tile_size=None, progress=None, num_neighbors=None, radius=None, workers=None, dist=None, graph=None, decay_function=None,
+                       method="PLANAR"):
+    # tradearea.GravityInteraction with the full matrix tiles spread over a pool of worker processes.
+    # Neighbor limited runs are already N*k and stay in process. Serial runs use the same tiles
+    workers = WorkerCount(workers)
+    if workers <= 1 or num_neighbors or radius or graph is not None:
+        return tradearea.GravityInteraction(xy, attr, ShardSize(len(attr), tile_size), progress, num_neighbors, radius, dist, graph, decay_function, method)
+    xy = np.asarray(xy, dtype="f8").reshape(-1, 2)
+    attr = np.asarray(attr, dtype="f8")
+    n = len(xy)
+
+    blocks = []
+    try:
+        # Features are both the origins and the destinations, share them once
+        specs = {"orig_xy": ShareArray(xy, blocks),
+                 "attr": ShareArray(attr, blocks),
+                 "out_max_prob": ShareArray(np.empty(n, dtype="i8"), blocks)}
+        specs["dest_xy"] = specs["orig_xy"]
+        if dist is not None:
+            specs["dist"] = ShareOrMap(dist, blocks)
+        shards = Shards(n, n, tile_size)
+        gravity_index = np.zeros(n)
+        movement = np.zeros(n)
+        with Pool(workers, specs) as pool:
+            max_dist = max(high for low, high in pool.map(RangeTask, shards, [method] * len(shards)))
+
+            # map yields in submission order, so the column sums are added in tile order
+            tasks = pool.map(InteractionTask, shards, [max_dist] * len(shards), [decay_function] * len(shards), [method] * len(shards))
+            for index, (tile_index, tile_movement, pairs, elapsed) in enumerate(tasks, 1):
+                gravity_index += tile_index
+                movement += tile_movement
+                tradearea.ReportTile(progress, index, len(shards), pairs, elapsed)
+
+        max_prob = SharedView(specs["out_max_prob"], blocks).copy()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return tradearea.InteractionResult(gravity_index, movement, tradearea.NetMovement(movement, attr), max_prob)
@@ -0,0 +1,157 @@
+'''----------------------------------------------------------------------------------
+ Source Name: profiling.py
+ Description: Per-stage timing and memory spans for the trade area tools. A tool run is wrapped
+              in Profile, and each stage is marked with Stage where the tools set their
+              progressor labels: a stage runs until the next one starts or the run ends. Every
+              span records its elapsed time, the rows it processed, the process peak memory and
+              how much the stage raised it, and the rows held in the in-memory workspace.
+
+              Spans go to the file given to Profile or in TRADEAREA_PROFILE: a .json path gets
+              one profile dump with a per-stage summary at the end of the run, any other path
+              gets one JSON line per span as it ends. Without a file nothing is recorded and a
+              Stage call returns straight away.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import contextlib
+import ctypes
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+try:
+    import resource
+except ImportError:
+    # Windows, peak memory comes from the process memory counters instead
+    resource = None
+
+# Environment variable naming the profile file when the tool is not given one
+PROFILE_ENV = "TRADEAREA_PROFILE"
+
+# One finished span. parent is the tool name for stages and None for the run itself
+SpanRecord = namedtuple("SpanRecord", ["tool", "name", "parent", "start", "seconds", "rows", "rows_per_second",
+                                       "peak_memory", "peak_growth", "workspace_rows", "pid", "error"])
+
+# Run being profiled: output path, workspace size callback, the open run and stage spans
+# ([name, start time, start counter, start peak, rows]) and the finished records
+_run = None
+
+
+def PeakMemory():
+    # High-water mark of the process memory in bytes, None where it cannot be read
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    if os.name == "nt":
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+
+def Enabled():
+    return _run is not None
+
+
+def Evaluate(value):
+    # Value of a lazy span field. One that cannot be read must not fail the tool
+    if not callable(value):
+        return value
+    try:
+        return value()
+    except Exception:
+        return None
+
+
+def OpenSpan(name):
+    return [name, time.time(), time.perf_counter(), PeakMemory(), None]
+
+
+def CloseSpan(span, parent, error=None):
+    # Finish an open span and write it out (JSON lines) or keep it for the dump
+    name, start, counter, start_peak, rows = span
+    seconds = time.perf_counter() - counter
+    rows = Evaluate(rows)
+    peak = PeakMemory()
+    workspace_rows = Evaluate(_run["workspace"])
+    record = SpanRecord(_run["tool"], name, parent, start, seconds, rows,
+                        rows / seconds if rows is not None and seconds > 0 else None, peak,
+                        peak - start_peak if peak is not None and start_peak is not None else None,
+                        workspace_rows, os.getpid(), error)
+    _run["records"].append(record)
+    if not _run["dump"]:
+        with open(_run["path"], "a") as profile:
+            profile.write(json.dumps(record._asdict()) + "\n")
+
+
+def Stage(name, rows=None):
+    # End the current stage and start the next one. rows is the number of rows the stage
+    # processes, or a function returning it that is only called when the stage ends
+    if _run is None:
+        return
+    if _run["stage"] is not None:
+        CloseSpan(_run["stage"], _run["tool"])
+    _run["stage"] = OpenSpan(name)
+    _run["stage"][4] = rows
+
+
+def Rows(rows):
+    # Set the rows of the current stage once they are known
+    if _run is not None and _run["stage"] is not None:
+        _run["stage"][4] = rows
+
+
+def Summary(records):
+    # Total time, rows and peak growth per stage name, slowest first
+    stages = {}
+    for record in records:
+        if record.parent is None:
+            continue
+        stage = stages.setdefault(record.name, {"name": record.name, "count": 0, "seconds": 0.0, "rows": 0, "peak_growth": 0})
+        stage["count"] += 1
+        stage["seconds"] += record.seconds
+        stage["rows"] += record.rows or 0
+        stage["peak_growth"] += record.peak_growth or 0
+    return sorted(stages.values(), key=lambda stage: -stage["seconds"])
+
+
+@contextlib.contextmanager
+def Profile(tool, path=None, workspace=None):
+    # Profile one tool run into path (or TRADEAREA_PROFILE). workspace is an optional function
+    # returning the rows held in the in-memory workspace. Runs inside a profiled run add their
+    # stages to it
+    global _run
+    path = path or os.environ.get(PROFILE_ENV)
+    if not path or _run is not None:
+        yield
+        return
+
+    _run = {"tool": tool, "path": path, "dump": path.lower().endswith(".json"), "workspace": workspace,
+            "root": OpenSpan(tool), "stage": None, "records": []}
+    error = None
+    try:
+        yield
+    except BaseException as exception:
+        error = f"{type(exception).__name__}: {exception}"
+        raise
+    finally:
+        try:
+            if _run["stage"] is not None:
+                CloseSpan(_run["stage"], tool, error)
+            CloseSpan(_run["root"], None, error)
+            if _run["dump"]:
+                with open(path, "w") as profile:
+                    json.dump({"tool": tool, "spans": [record._asdict() for record in _run["records"]],
+                               "summary": Summary(_run["records"])}, profile, indent=2)
+        finally:
+            _run = None
@@ -0,0 +1,134 @@
+'''----------------------------------------------------------------------------------
+ Source Name: scenarios.py
+ Description: Batch evaluation of candidate store openings and closures against one Huff model
+              (GravityModel) base run. The base numerators, per origin sums and the two best
+              destinations of every origin are computed once; each scenario is then costed as a
+              column delta on those arrays, so a sweep over hundreds of candidate sites costs
+              about as much as a few single runs.
+
+              Every scenario is scored over the distance range of its own stores, as a
+              GravityModel run on them would be. A scenario whose new or closed stores move the
+              base range rescales every distance and is rebuilt in full, as incremental.HuffUpdate
+              does; the others are costed as column deltas on the base run.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+from collections import namedtuple
+
+import numpy as np
+
+import incremental
+import tradearea
+
+# inserts are new destinations [(x, y, attr)], deletes are indices of base destinations to close
+Scenario = namedtuple("Scenario", ["name", "inserts", "deletes"])
+
+# Base run shared by every scenario. dist and num are origins x destinations, best/second the two
+# destinations with the largest numerators of each origin, col_min/col_max the distance range of
+# each destination
+ScenarioBase = namedtuple("ScenarioBase", ["orig_xy", "attr", "dist", "num", "sum_num", "best", "second", "weights",
+                                           "min_dist", "max_dist", "col_min", "col_max", "method", "decay_function"])
+
+
+def ScenarioBaseRun(orig_xy, dest_xy, attr, weights=None, dist=None, method="PLANAR", decay_function=None):
+    # Base Huff numerators over the base distance range, the same as a GravityModel run.
+    # dist is an optional precomputed origins x destinations matrix (distcache) of the same method
+    orig_xy = np.asarray(orig_xy, dtype="f8").reshape(-1, 2)
+    dest_xy = np.asarray(dest_xy, dtype="f8").reshape(-1, 2)
+    attr = np.asarray(attr, dtype="f8")
+    dist = tradearea.DistanceMatrix(orig_xy, dest_xy, method) if dist is None else np.asarray(dist)
+    col_min, col_max = dist.min(axis=0), dist.max(axis=0)
+    min_dist, max_dist = col_min.min(), col_max.max()
+
+    num = incremental.HuffKernel(dist, min_dist, max_dist, decay_function) * attr[None, :]
+    best = num.argmax(axis=1)
+    rows = np.arange(len(orig_xy))
+    runner_up = num.copy()
+    runner_up[rows, best] = -np.inf
+    second = runner_up.argmax(axis=1) if num.shape[1] > 1 else best
+    weights = np.ones(len(orig_xy)) if weights is None else np.asarray(weights, dtype="f8")
+    return ScenarioBase(orig_xy, attr, dist, num, num.sum(axis=1), best, second, weights, min_dist, max_dist, col_min, col_max,
+                        method, decay_function)
+
+
+def EvaluateScenario(base, scenario):
+    # Captured share of the inserted stores, base share of the closed ones and the weight of the
+    # origins whose HIGH_DEST changes, in O(origins x changed stores) unless the range moves
+    n, m = base.num.shape
+    rows = np.arange(n)
+    deletes = np.asarray(list(scenario.deletes), dtype="i8")
+    closed = np.zeros(m, dtype=bool)
+    closed[deletes] = True
+    inserted = [(tradearea.DistanceMatrix(base.orig_xy, [(x, y)], base.method)[:, 0], value) for x, y, value in scenario.inserts]
+
+    # Distance range of the stores open in the scenario, a different one rescales every distance
+    bounds = [(dist.min(), dist.max()) for dist, value in inserted]
+    if not closed.all():
+        bounds.append((base.col_min[~closed].min(), base.col_max[~closed].max()))
+    if bounds:
+        min_dist, max_dist = min(low for low, high in bounds), max(high for low, high in bounds)
+        if (min_dist, max_dist) != (base.min_dist, base.max_dist):
+            return RebuiltScenario(base, deletes, closed, inserted, min_dist, max_dist)
+
+    # New numerator columns
+    sum_num = base.sum_num - base.num[:, deletes].sum(axis=1)
+    added = np.zeros(n)
+    added_best = np.full(n, -np.inf)
+    added_index = np.full(n, -1)
+    for position, (dist, value) in enumerate(inserted):
+        column = incremental.HuffKernel(dist, base.min_dist, base.max_dist, base.decay_function) * value
+        added += column
+        wins = column > added_best
+        added_best[wins] = column[wins]
+        added_index[wins] = m + position
+    sum_num = sum_num + added
+
+    # Best remaining base destination: the base best, else the runner up, else a rescan
+    kept = np.where(~closed[base.best], base.best, np.where(~closed[base.second], base.second, -1))
+    rescan = np.flatnonzero(kept < 0)
+    if len(rescan) and not closed.all():
+        kept[rescan] = np.where(closed[None, :], -np.inf, base.num[rescan]).argmax(axis=1)
+    kept_value = np.where(kept >= 0, base.num[rows, np.maximum(kept, 0)], -np.inf)
+    high_dest = np.where(added_best > kept_value, added_index, kept)
+    return Shares(base, deletes, added, sum_num, high_dest)
+
+
+def RebuiltScenario(base, deletes, closed, inserted, min_dist, max_dist):
+    # Scenario over its own distance range: every numerator is rescaled, the open base stores
+    # first and the inserted ones after them as in EvaluateScenario
+    num = incremental.HuffKernel(base.dist, min_dist, max_dist, base.decay_function) * base.attr[None, :]
+    num[:, closed] = 0
+    columns = [incremental.HuffKernel(dist, min_dist, max_dist, base.decay_function) * value for dist, value in inserted]
+    num = np.column_stack([num] + columns)
+    open_stores = np.append(~closed, np.ones(len(columns), dtype=bool))
+    high_dest = np.where(open_stores[None, :], num, -np.inf).argmax(axis=1)
+    added = num[:, len(closed):].sum(axis=1)
+    return Shares(base, deletes, added, num.sum(axis=1), high_dest)
+
+
+def Shares(base, deletes, added, sum_num, high_dest):
+    # Captured share of the inserted numerators, base share of the closed stores and the weight
+    # of the origins whose HIGH_DEST differs from the base run
+    total = base.weights.sum()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        captured = np.nansum(base.weights * added / sum_num) / total
+        lost = np.nansum(base.weights * base.num[:, deletes].sum(axis=1) / base.sum_num) / total
+    changed = base.weights[high_dest != base.best].sum()
+    return captured, lost, changed
+
+
+def EvaluateScenarios(orig_xy, dest_xy, attr, scenarios, weights=None, dist=None, method="PLANAR", decay_function=None):
+    # Ranked summary table: highest captured share first, then least base share lost
+    scenarios = list(scenarios)
+    base = ScenarioBaseRun(orig_xy, dest_xy, attr, weights, dist, method, decay_function)
+
+    width = max([len(str(scenario.name)) for scenario in scenarios] + [1])
+    summary = np.zeros(len(scenarios), dtype=[("RANK", "<i4"), ("SCENARIO", f"<U{width}"), ("CAPTURED_SHARE", "<f8"),
+                                              ("LOST_SHARE", "<f8"), ("HIGH_DEST_CHANGED", "<f8")])
+    for i, scenario in enumerate(scenarios):
+        summary[i]["SCENARIO"] = str(scenario.name)
+        summary[i]["CAPTURED_SHARE"], summary[i]["LOST_SHARE"], summary[i]["HIGH_DEST_CHANGED"] = EvaluateScenario(base, scenario)
+
+    summary = summary[np.lexsort((summary["LOST_SHARE"], -summary["CAPTURED_SHARE"]))]
+    summary["RANK"] = np.arange(1, len(summary) + 1)
+    return summary
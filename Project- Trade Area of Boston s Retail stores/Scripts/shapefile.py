@@ -0,0 +1,378 @@
+'''----------------------------------------------------------------------------------
+ Source Name: shapefile.py
+ Description: Shapefile and dBASE I/O for the tradearea engine without arcpy. The .shp, .shx
+              and .dbf files are memory-mapped and read column by column: feature centroids
+              (what SHAPE@XY returns) are computed for all records at once and attribute fields
+              are converted as whole arrays. Results are written back the same way, one
+              fixed-width byte array per field, so a run never goes through per-row cursors.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import datetime
+import math
+import os
+import re
+import shutil
+
+import numpy as np
+
+# Shape types by family (plain, Z and M variants)
+POINT_TYPES = (1, 11, 21)
+POLYLINE_TYPES = (3, 13, 23)
+POLYGON_TYPES = (5, 15, 25)
+MULTIPOINT_TYPES = (8, 18, 28)
+
+
+def BasePath(path):
+    # "folder/name.shp" and "folder/name" name the same shapefile
+    root, extension = os.path.splitext(path)
+    return root if extension.lower() in (".shp", ".shx", ".dbf") else path
+
+
+def Encoding(path):
+    # Code page of the .dbf from the .cpg next to it, UTF-8 when there is none
+    try:
+        with open(BasePath(path) + ".cpg") as cpg:
+            return cpg.read().strip() or "utf-8"
+    except OSError:
+        return "utf-8"
+
+
+def Runs(starts, counts):
+    # Concatenated ranges [start, start + count) for every pair
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def Gather(buffer, positions, dtype):
+    # Values of dtype at the given byte positions of a memory-mapped file
+    dtype = np.dtype(dtype)
+    index = np.asarray(positions, dtype="i8")[:, None] + np.arange(dtype.itemsize)
+    return np.ascontiguousarray(buffer[index]).view(dtype).ravel()
+
+
+def ReadCentroids(path, deleted=None):
+    # Centroid of every record: the point itself, the mean of a multipoint, the length weighted
+    # middle of a polyline or the area centroid of a polygon (holes subtracted). Null shapes are NaN.
+    # Records flagged in deleted (the mask ReadTable returns) are left out
+    base = BasePath(path)
+    shx = np.memmap(base + ".shx", dtype="u1", mode="r")
+    shp = np.memmap(base + ".shp", dtype="u1", mode="r")
+    n = (len(shx) - 100) // 8
+    offsets = np.frombuffer(shx[100:100 + 8 * n], dtype=">i4").reshape(n, 2)[:, 0].astype("i8") * 2
+
+    # Content starts after the 8 byte record header
+    content = offsets + 8
+    shape_types = Gather(shp, content, "<i4")
+    xy = np.full((n, 2), np.nan)
+    if not n:
+        return xy if deleted is None else xy[~deleted]
+
+    points = np.isin(shape_types, POINT_TYPES)
+    if points.any():
+        xy[points] = Gather(shp, content[points] + 4, "<f8,<f8").view("<f8").reshape(-1, 2)
+
+    multipoints = np.isin(shape_types, MULTIPOINT_TYPES)
+    if multipoints.any():
+        records = np.flatnonzero(multipoints)
+        counts = Gather(shp, content[records] + 36, "<i4").astype("i8")
+        vertices = Gather(shp, Runs(content[records] + 40, counts * 16)[::8], "<f8").reshape(-1, 2)
+        owner = np.repeat(np.arange(len(records)), counts)
+        xy[records, 0] = np.bincount(owner, vertices[:, 0], len(records)) / counts
+        xy[records, 1] = np.bincount(owner, vertices[:, 1], len(records)) / counts
+
+    lines = np.isin(shape_types, POLYLINE_TYPES) | np.isin(shape_types, POLYGON_TYPES)
+    if lines.any():
+        records = np.flatnonzero(lines)
+        xy[records] = PartCentroids(shp, content[records], np.isin(shape_types[records], POLYGON_TYPES))
+    return xy if deleted is None else xy[~deleted]
+
+
+def PartCentroids(shp, content, polygons):
+    # Polyline and polygon centroids, all records in one vectorised pass over their vertices
+    m = len(content)
+    num_parts = Gather(shp, content + 36, "<i4").astype("i8")
+    num_points = Gather(shp, content + 40, "<i4").astype("i8")
+    part_starts = Gather(shp, Runs(content + 44, num_parts * 4)[::4], "<i4").astype("i8")
+    first_point = content + 44 + 4 * num_parts
+    vertices = Gather(shp, Runs(first_point, num_points * 16)[::8], "<f8").reshape(-1, 2)
+    owner = np.repeat(np.arange(m), num_points)
+
+    # Coordinates relative to each record's first vertex keep the products small
+    record_first = np.cumsum(num_points) - num_points
+    origin = vertices[np.minimum(record_first, len(vertices) - 1)] if len(vertices) else np.zeros((m, 2))
+    local = vertices - origin[owner]
+
+    # A segment joins each vertex to the next one unless it is the last vertex of its part
+    part_record = np.repeat(np.arange(m), num_parts)
+    part_ends = np.zeros(len(vertices), dtype=bool)
+    part_ends[record_first[part_record] + NextPartStart(part_starts, num_parts, num_points) - 1] = True
+    segment = np.flatnonzero(~part_ends)
+    x0, y0 = local[segment, 0], local[segment, 1]
+    x1, y1 = local[segment + 1, 0], local[segment + 1, 1]
+    seg_owner = owner[segment]
+
+    centroid = np.full((m, 2), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Polylines: segment midpoints weighted by length
+        length = np.hypot(x1 - x0, y1 - y0)
+        total = np.bincount(seg_owner, length, m)
+        line_xy = np.column_stack([np.bincount(seg_owner, length * (x0 + x1) / 2, m), np.bincount(seg_owner, length * (y0 + y1) / 2, m)]) / total[:, None]
+
+        # Polygons: shoelace area and centroid, holes wind the other way and subtract themselves
+        cross = x0 * y1 - x1 * y0
+        area2 = np.bincount(seg_owner, cross, m)
+        poly_xy = np.column_stack([np.bincount(seg_owner, (x0 + x1) * cross, m), np.bincount(seg_owner, (y0 + y1) * cross, m)]) / (3 * area2[:, None])
+
+        # Degenerate shapes fall back to the mean vertex
+        mean_xy = np.column_stack([np.bincount(owner, local[:, 0], m), np.bincount(owner, local[:, 1], m)]) / num_points[:, None]
+    centroid[:] = np.where(polygons[:, None], poly_xy, line_xy)
+    degenerate = ~np.isfinite(centroid).all(axis=1)
+    centroid[degenerate] = mean_xy[degenerate]
+    return centroid + origin
+
+
+def NextPartStart(part_starts, num_parts, num_points):
+    # For every part, the index (within its record) of the vertex after its last one
+    next_start = np.append(part_starts[1:], 0)
+    last_part = np.cumsum(num_parts) - 1
+    next_start[last_part[num_parts > 0]] = num_points[num_parts > 0]
+    return next_start
+
+
+def ReadFields(path):
+    # (name, type, length, decimals) of every .dbf field and the header and record lengths
+    with open(BasePath(path) + ".dbf", "rb") as dbf:
+        header = dbf.read(32)
+        count = int(np.frombuffer(header[4:8], "<u4")[0])
+        header_length, record_length = (int(value) for value in np.frombuffer(header[8:12], "<u2"))
+        descriptors = dbf.read(header_length - 32)
+    fields = []
+    for start in range(0, len(descriptors) - 1, 32):
+        descriptor = descriptors[start:start + 32]
+        if descriptor[0] == 0x0D:
+            break
+        name = descriptor[:11].split(b"\0")[0].decode("ascii", "replace")
+        fields.append((name, chr(descriptor[11]), descriptor[16], descriptor[17]))
+    return fields, count, header_length, record_length
+
+
+def ReadTable(path, field_names=None):
+    # .dbf columns as arrays keyed by field name: numbers as float (blank is NaN) or int when every
+    # value is a whole number, text as str, logicals as bool and dates as datetime64. Deleted
+    # records are left out, as arcpy skips them; the mask of them over all records is returned
+    # with the table so the centroids and geometry can drop the same records
+    fields, count, header_length, record_length = ReadFields(path)
+    dtype = np.dtype({"names": ["_deleted"] + [name for name, _, _, _ in fields],
+                      "formats": ["S1"] + [f"S{length}" for _, _, length, _ in fields],
+                      "offsets": [0] + list(np.cumsum([1] + [length for _, _, length, _ in fields])[:-1]),
+                      "itemsize": record_length})
+    records = np.memmap(BasePath(path) + ".dbf", dtype=dtype, mode="r", offset=header_length, shape=(count,)) if count else np.empty(0, dtype)
+    deleted = records["_deleted"] == b"*"
+    kept = ~deleted
+    encoding = Encoding(path)
+
+    table = {}
+    wanted = None if field_names is None else {name.upper() for name in field_names}
+    for name, field_type, length, decimals in fields:
+        if wanted is not None and name.upper() not in wanted:
+            continue
+        raw = np.char.strip(np.asarray(records[name][kept]))
+        if field_type in "NFO":
+            values = np.full(len(raw), np.nan)
+            present = (raw != b"") & ~np.char.startswith(raw, b"*")
+            values[present] = raw[present].astype("f8")
+            if decimals == 0 and present.all() and np.all(values == np.round(values)) and np.abs(values).max(initial=0) < 2 ** 53:
+                values = values.astype("i8")
+            table[name] = values
+        elif field_type == "L":
+            table[name] = np.isin(raw, [b"T", b"t", b"Y", b"y"])
+        elif field_type == "D":
+            values = np.full(len(raw), np.datetime64("NaT"), dtype="datetime64[D]")
+            present = np.char.str_len(raw) == 8
+            text = np.char.decode(raw[present], "ascii")
+            values[present] = np.array([f"{day[:4]}-{day[4:6]}-{day[6:]}" for day in text], dtype="datetime64[D]")
+            table[name] = values
+        else:
+            table[name] = np.char.decode(raw, encoding, "replace")
+    return table, np.asarray(deleted)
+
+
+def ReadShapefile(path, field_names=None):
+    # Centroids and attribute columns of a shapefile, in record order (FID), without deleted records
+    table, deleted = ReadTable(path, field_names)
+    return ReadCentroids(path, deleted), table
+
+
+def SpatialReference(path):
+    # WKT of the .prj, empty when there is none
+    try:
+        with open(BasePath(path) + ".prj") as prj:
+            return prj.read().strip()
+    except OSError:
+        return ""
+
+
+def IsGeographic(path):
+    return SpatialReference(path).upper().startswith("GEOGCS")
+
+
+def WktTokens(wkt):
+    # Keywords and names (upper case) and numbers (as float) of a WKT string, in order
+    tokens = []
+    for name, number, word in re.findall(r'"([^"]*)"|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|([A-Za-z_]\w*)', wkt):
+        tokens.append(float(number) if number else (name or word).upper())
+    return tokens
+
+
+def SameSpatialReference(path, other):
+    # Whether two .prj describe the same coordinate system. Writers differ in "6378137" vs
+    # "6378137.0" and in how many digits of a degree they keep, so numbers are compared to 12
+    # significant digits rather than as text
+    tokens, other_tokens = WktTokens(SpatialReference(path)), WktTokens(SpatialReference(other))
+    if len(tokens) != len(other_tokens):
+        return False
+    for token, other_token in zip(tokens, other_tokens):
+        if isinstance(token, float) and isinstance(other_token, float):
+            if not math.isclose(token, other_token, rel_tol=1e-12, abs_tol=1e-12):
+                return False
+        elif token != other_token:
+            return False
+    return True
+
+
+def FieldNames(names):
+    # dBASE field names: at most 10 letters, digits or underscores, starting with a letter, unique
+    valid = []
+    for name in names:
+        field = re.sub(r"[^0-9A-Za-z_]", "_", str(name)) or "F"
+        if not field[0].isalpha():
+            field = "F" + field
+        field = candidate = field[:10]
+        suffix = 1
+        while candidate.upper() in (existing.upper() for existing in valid):
+            candidate = f"{field[:10 - len(str(suffix)) - 1]}_{suffix}"
+            suffix += 1
+        valid.append(candidate)
+    return valid
+
+
+def FormatColumn(values, encoding):
+    # One column as fixed-width bytes plus its (type, length, decimals)
+    values = np.asarray(values)
+    if values.dtype.kind == "b":
+        return np.where(values, b"T", b"F").astype("S1"), ("L", 1, 0)
+    if values.dtype.kind in "iu":
+        text = np.char.mod("%d", values)
+        width = max(int(np.char.str_len(text).max(initial=1)), 1)
+        return np.char.rjust(text, width).astype(f"S{width}"), ("N", width, 0)
+    if values.dtype.kind == "f":
+        # Esri's double layout, switching to exponent notation for values too wide for it
+        finite = np.isfinite(values)
+        large = np.abs(values[finite]).max(initial=0) >= 1e7
+        text = np.char.mod("%24.15e" if large else "%24.15f", np.where(finite, values, 0))
+        text[~finite] = " " * 24
+        return text.astype("S24"), ("N", 24, 15)
+    if values.dtype.kind == "M":
+        days = values.astype("datetime64[D]")
+        text = np.char.replace(days.astype("U10"), "-", "")
+        text[np.isnat(days)] = " " * 8
+        return text.astype("S8"), ("D", 8, 0)
+    encoded = np.char.encode(values.astype("U"), encoding)
+    width = min(max(int(np.char.str_len(encoded).max(initial=1)), 1), 254)
+    return np.char.ljust(encoded.astype(f"S{width}"), width), ("C", width, 0)
+
+
+def WriteTable(path, columns, encoding="utf-8"):
+    # Write columns ({name: array}, in order) as a .dbf in one go, plus its .cpg
+    base = BasePath(path)
+    names = FieldNames(columns)
+    formatted = [FormatColumn(values, encoding) for values in columns.values()]
+    count = len(formatted[0][0]) if formatted else 0
+    record_length = 1 + sum(spec[1] for _, spec in formatted)
+    header_length = 32 + 32 * len(names) + 1
+
+    today = datetime.date.today()
+    header = bytearray(32)
+    header[0] = 3
+    header[1:4] = bytes([today.year - 1900, today.month, today.day])
+    header[4:8] = np.uint32(count).tobytes()
+    header[8:10] = np.uint16(header_length).tobytes()
+    header[10:12] = np.uint16(record_length).tobytes()
+    for name, (_, (field_type, length, decimals)) in zip(names, formatted):
+        descriptor = bytearray(32)
+        descriptor[:len(name)] = name.encode("ascii")
+        descriptor[11] = ord(field_type)
+        descriptor[16] = length
+        descriptor[17] = decimals
+        header += descriptor
+    header += b"\x0D"
+
+    records = np.empty(count, dtype=[("_deleted", "S1")] + [(f"f{i}", f"S{spec[1]}") for i, (_, spec) in enumerate(formatted)])
+    records["_deleted"] = b" "
+    for i, (text, _) in enumerate(formatted):
+        records[f"f{i}"] = text
+    with open(base + ".dbf", "wb") as dbf:
+        dbf.write(header)
+        # S fields drop trailing spaces on assignment but keep their width as NUL padding
+        dbf.write(records.tobytes().replace(b"\0", b" ") if count else b"")
+        dbf.write(b"\x1A")
+    with open(base + ".cpg", "w") as cpg:
+        cpg.write(encoding.upper())
+
+
+def WriteGeometry(in_path, out_path, kept):
+    # .shp and .shx of the kept records of in_path: records renumbered from 1, the index rebuilt
+    # and the header file length and bounding box set for the records left
+    source, target = BasePath(in_path), BasePath(out_path)
+    shx = np.memmap(source + ".shx", dtype="u1", mode="r")
+    shp = np.memmap(source + ".shp", dtype="u1", mode="r")
+    n = (len(shx) - 100) // 8
+    index = np.frombuffer(shx[100:100 + 8 * n], dtype=">i4").reshape(n, 2).astype("i8") * 2
+    records = np.flatnonzero(kept)
+    offsets, lengths = index[records, 0], index[records, 1] + 8
+    m = len(records)
+
+    body = np.asarray(shp[Runs(offsets, lengths)]) if m else np.empty(0, dtype="u1")
+    new_offsets = 100 + np.cumsum(lengths) - lengths
+    body[Runs(new_offsets - 100, np.full(m, 4))] = np.arange(1, m + 1, dtype=">i4").view("u1")
+
+    # Bounding box of the kept records: the point itself or the box each other record stores
+    content = offsets + 8
+    shape_types = Gather(shp, content, "<i4") if m else np.empty(0, dtype="<i4")
+    boxes = np.full((m, 4), np.nan)
+    points = np.isin(shape_types, POINT_TYPES)
+    if points.any():
+        xy = Gather(shp, content[points] + 4, "<f8,<f8").view("<f8").reshape(-1, 2)
+        boxes[points] = np.hstack([xy, xy])
+    others = (shape_types != 0) & ~points
+    if others.any():
+        boxes[others] = Gather(shp, content[others] + 4, "<f8,<f8,<f8,<f8").view("<f8").reshape(-1, 4)
+
+    header = bytearray(shp[:100])
+    if not np.isnan(boxes).all():
+        header[36:68] = np.array([np.nanmin(boxes[:, 0]), np.nanmin(boxes[:, 1]), np.nanmax(boxes[:, 2]), np.nanmax(boxes[:, 3])], dtype="<f8").tobytes()
+    header[24:28] = np.array([(100 + len(body)) // 2], dtype=">i4").tobytes()
+    with open(target + ".shp", "wb") as out:
+        out.write(header)
+        out.write(body.tobytes())
+
+    header[24:28] = np.array([(100 + 8 * m) // 2], dtype=">i4").tobytes()
+    with open(target + ".shx", "wb") as out:
+        out.write(header)
+        out.write(np.column_stack([new_offsets // 2, lengths // 2 - 4]).astype(">i4").tobytes())
+
+
+def CopyShapefile(in_path, out_path, columns, encoding="utf-8", deleted=None):
+    # New shapefile with the geometry of in_path and columns as its table. The geometry is copied
+    # byte for byte, or without the records flagged in deleted so it matches the table
+    source, target = BasePath(in_path), BasePath(out_path)
+    extensions = (".shp", ".shx", ".prj")
+    if deleted is not None and deleted.any():
+        WriteGeometry(source, target, ~deleted)
+        extensions = (".prj",)
+    for extension in extensions:
+        if os.path.exists(source + extension):
+            shutil.copyfile(source + extension, target + extension)
+    WriteTable(target, columns, encoding)
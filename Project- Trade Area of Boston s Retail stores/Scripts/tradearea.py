@@ -0,0 +1,248 @@
+'''----------------------------------------------------------------------------------
+ Source Name: tradearea.py
+ Description: In-process NumPy engine for the trade area tools. Works on plain coordinate
+              and attribute arrays so it can run without arcpy or a license check; the
+              script tools read their inputs into arrays and hand them to these functions.
+----------------------------------------------------------------------------------'''
+
+# Import system modules
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import decay
+import geodesic
+import neighbors
+
+# Result of a Huff model run: per origin probabilities (origins x destinations), index of the
+# destination with the highest probability and the per origin denominator (SUM_num). An origin
+# no destination reaches (SUM_num 0, e.g. all beyond a CUTOFF) has zero probabilities and -1
+HuffResult = namedtuple("HuffResult", ["prob", "high_dest", "sum_num"])
+
+# Result of the spatial interaction (Gravity) run, one value per feature. max_prob is the index
+# of the feature each one is most likely to move to (MAX_PROB_IN_FID)
+InteractionResult = namedtuple("InteractionResult", ["gravity_index", "movement", "net_movement", "max_prob"])
+
+# Totals and ranges of the centrality inputs (weight, SUM_DIST, WEIGHTED_CENTER_DIST), gathered
+# in one pass over the features
+CentralityStats = namedtuple("CentralityStats", ["count", "sum_dist", "sum_center", "min_attr", "max_attr",
+                                                 "min_dist", "max_dist", "min_center", "max_center"])
+
+
+def Tiles(n, tile_size=None):
+    # Blocks of origins processed together, the whole set when no tile size is given
+    if not tile_size or tile_size >= n:
+        yield slice(0, n)
+        return
+    for start in range(0, n, int(tile_size)):
+        yield slice(start, min(start + int(tile_size), n))
+
+
+def ReportTile(progress, index, tile_count, pairs, elapsed):
+    # Send the throughput of a finished tile to the progress callback (arcpy.AddMessage in the tools)
+    if progress is None:
+        return
+    rate = pairs / elapsed if elapsed > 0 else float("inf")
+    progress(f"Tile {index}/{tile_count}: {pairs:,} pairs in {elapsed:.2f}s ({rate:,.0f} pairs/s)")
+
+
+def DistanceMatrix(orig_xy, dest_xy, method="PLANAR"):
+    # Planar distances between every origin and destination, same as GenerateNearTable. The
+    # HAVERSINE and GEODESIC methods take longitude/latitude coordinates and return meters
+    orig_xy = np.asarray(orig_xy, dtype="f8").reshape(-1, 2)
+    dest_xy = np.asarray(dest_xy, dtype="f8").reshape(-1, 2)
+    if method.upper() != "PLANAR":
+        return geodesic.DistanceMatrix(orig_xy, dest_xy, method)
+    dx = orig_xy[:, 0, None] - dest_xy[None, :, 0]
+    dy = orig_xy[:, 1, None] - dest_xy[None, :, 1]
+    return np.hypot(dx, dy)
+
+
+def TileDistances(orig_xy, dest_xy, tile, dist=None, method="PLANAR"):
+    # Distances for one block of origins, read from a precomputed (e.g. cached, memory-mapped)
+    # matrix when one is given and computed with method otherwise
+    if dist is not None:
+        return np.asarray(dist[tile])
+    return DistanceMatrix(orig_xy[tile], dest_xy, method)
+
+
+def DistanceRange(orig_xy, dest_xy, tile_size=None, dist=None, method="PLANAR"):
+    # Min and max distance over all pairs without holding the whole matrix
+    min_dist, max_dist = np.inf, -np.inf
+    for tile in Tiles(len(orig_xy), tile_size):
+        tile_dist = TileDistances(orig_xy, dest_xy, tile, dist, method)
+        min_dist = min(min_dist, tile_dist.min())
+        max_dist = max(max_dist, tile_dist.max())
+    return min_dist, max_dist
+
+
+def RescaleDistances(dist, min_dist, max_dist):
+    # Transform NEAR_DIST values to scale of 0-10 (matches the CalculateField expression in gravity.py)
+    return ((dist - min_dist) / (float(max_dist + 0.000001) - min_dist)) * 10
+
+
+def rescale(val, in_min, in_max, out_min, out_max):
+    return out_min + (val - in_min) * ((out_max - out_min) / (in_max - in_min))
+
+
+def HuffProbabilities(dist, attr, decay_function=None):
+    # Gravity model numerator (mass X distance decay, inverse exp distanceX2 by default),
+    # denominator and probability
+    num = attr[None, :] * (decay_function or decay.HUFF_DECAY)(dist)
+    sum_num = num.sum(axis=1)
+    reached = sum_num > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prob = np.where(reached[:, None], num / sum_num[:, None], 0.0)
+    return HuffResult(prob, np.where(reached, prob.argmax(axis=1), -1), sum_num)
+
+
+def HuffTile(orig_xy, dest_xy, attr, tile, min_dist, max_dist, dist=None, decay_function=None, method="PLANAR"):
+    # Huff model for one block of origins
+    tile_dist = RescaleDistances(TileDistances(orig_xy, dest_xy, tile, dist, method), min_dist, max_dist)
+    return HuffProbabilities(tile_dist, attr, decay_function)
+
+
+def HuffTiles(orig_xy, dest_xy, attr, tile_size=None, progress=None, dist=None, decay_function=None, method="PLANAR"):
+    # Stream the Huff model one block of origins at a time. Each origin is normalised by its own
+    # row sum, so only the distance rescaling needs a pass over all pairs first
+    orig_xy = np.asarray(orig_xy, dtype="f8").reshape(-1, 2)
+    dest_xy = np.asarray(dest_xy, dtype="f8").reshape(-1, 2)
+    attr = np.asarray(attr, dtype="f8")
+    min_dist, max_dist = DistanceRange(orig_xy, dest_xy, tile_size, dist, method)
+
+    tile_count = math.ceil(len(orig_xy) / tile_size) if tile_size else 1
+    for index, tile in enumerate(Tiles(len(orig_xy), tile_size), 1):
+        start = time.perf_counter()
+        result = HuffTile(orig_xy, dest_xy, attr, tile, min_dist, max_dist, dist, decay_function, method)
+        ReportTile(progress, index, tile_count, result.prob.size, time.perf_counter() - start)
+        yield tile, result
+
+
+def HuffModel(orig_xy, dest_xy, attr, tile_size=None, progress=None, dist=None, decay_function=None, method="PLANAR"):
+    # Probabilistic attraction of every origin towards every destination
+    n, m = len(orig_xy), len(attr)
+    prob = np.empty((n, m))
+    high_dest = np.empty(n, dtype="i8")
+    sum_num = np.empty(n)
+    for tile, result in HuffTiles(orig_xy, dest_xy, attr, tile_size, progress, dist, decay_function, method):
+        prob[tile] = result.prob
+        high_dest[tile] = result.high_dest
+        sum_num[tile] = result.sum_num
+    return HuffResult(prob, high_dest, sum_num)
+
+
+def GravityInteraction(xy, attr, tile_size=None, progress=None, num_neighbors=None, radius=None, dist=None, graph=None, decay_function=None, method="PLANAR"):
+    # Spatial interaction between every pair of features, self pairs included at distance 0.
+    # A precomputed distance matrix (dist) or neighbor graph (graph) skips the distance step
+    xy = np.asarray(xy, dtype="f8").reshape(-1, 2)
+    attr = np.asarray(attr, dtype="f8")
+    n = len(xy)
+    if graph is not None:
+        return SparseGravityInteraction(graph, attr, decay_function)
+    if num_neighbors or radius:
+        return SparseGravityInteraction(neighbors.SelfNeighbors(xy, num_neighbors, radius, method), attr, decay_function)
+    max_dist = DistanceRange(xy, xy, tile_size, dist, method)[1]
+
+    gravity_index = np.zeros(n)
+    movement = np.zeros(n)
+    max_prob = np.empty(n, dtype="i8")
+    tile_count = math.ceil(n / tile_size) if tile_size else 1
+    for index, tile in enumerate(Tiles(n, tile_size), 1):
+        start = time.perf_counter()
+        tile_index, tile_movement, max_prob[tile] = InteractionTile(xy, attr, tile, max_dist, dist, decay_function, method)
+
+        # Column sums per NEAR_FID accumulate across tiles
+        gravity_index += tile_index
+        movement += tile_movement
+        ReportTile(progress, index, tile_count, (tile.stop - tile.start) * n, time.perf_counter() - start)
+
+    return InteractionResult(gravity_index, movement, NetMovement(movement, attr), max_prob)
+
+
+def InteractionTile(xy, attr, tile, max_dist, dist=None, decay_function=None, method="PLANAR"):
+    # Weight x distance decay (inverse distance by default), probability per IN_FID (SUM_X_INVDIST
+    # is local to the tile rows). Returns this tile's column sums of probability and movement, and
+    # the argmax of each row
+    tile_dist = TileDistances(xy, xy, tile, dist, method)
+    weighted = attr[None, :] * (decay_function or decay.INTERACTION_DECAY)(rescale(tile_dist, 0, max_dist, 1, 10))
+    prob = (weighted / weighted.sum(axis=1)[:, None]) * 100
+    return prob.sum(axis=0), ((prob / 100) * attr[tile, None]).sum(axis=0), prob.argmax(axis=1)
+
+
+def SparseGravityInteraction(graph, attr, decay_function=None):
+    # Same scores as GravityInteraction over the rows of a neighbors.NeighborGraph only
+    n = len(graph.indptr) - 1
+    rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+    max_dist = graph.distances.max() if len(graph.distances) else 0
+
+    # Weight x distance decay and probability per IN_FID row
+    weighted = attr[graph.indices] * (decay_function or decay.INTERACTION_DECAY)(rescale(graph.distances, 0, max_dist, 1, 10))
+    sum_weighted = np.bincount(rows, weighted, minlength=n)
+    prob = (weighted / sum_weighted[rows]) * 100
+
+    # Sums per NEAR_FID and the most probable NEAR_FID of each row
+    gravity_index = np.bincount(graph.indices, prob, minlength=n)
+    movement = np.bincount(graph.indices, (prob / 100) * attr[rows], minlength=n)
+    order = np.lexsort((-prob, rows))
+    max_prob = graph.indices[order[graph.indptr[:-1]]]
+
+    return InteractionResult(gravity_index, movement, NetMovement(movement, attr), max_prob)
+
+
+def NetMovement(movement, attr):
+    # Projected movement into each feature relative to its own weight, as a percentage
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return ((movement - attr) / attr) * 100
+
+
+def SumDistances(xy, num_neighbors=None, tile_size=None, progress=None, dist=None, graph=None, method="PLANAR"):
+    # Sum of distances from each feature to all others (or its num_neighbors nearest), self excluded
+    xy = np.asarray(xy, dtype="f8").reshape(-1, 2)
+    n = len(xy)
+    if graph is None and num_neighbors and num_neighbors < n - 1:
+        graph = neighbors.SelfNeighbors(xy, num_neighbors, None, method)
+    if graph is not None:
+        return np.add.reduceat(graph.distances, graph.indptr[:-1]) if n else np.empty(0)
+
+    sum_dist = np.empty(n)
+    tile_count = math.ceil(n / tile_size) if tile_size else 1
+    for index, tile in enumerate(Tiles(n, tile_size), 1):
+        start = time.perf_counter()
+        tile_dist = TileDistances(xy, xy, tile, dist, method)
+        sum_dist[tile] = tile_dist.sum(axis=1)
+        ReportTile(progress, index, tile_count, tile_dist.size, time.perf_counter() - start)
+    return sum_dist
+
+
+def CentralityStatistics(rows):
+    # Stream (weight, SUM_DIST, WEIGHTED_CENTER_DIST) rows once, e.g. straight from a SearchCursor
+    count = sum_dist = sum_center = 0
+    min_attr = min_dist = min_center = math.inf
+    max_attr = max_dist = max_center = -math.inf
+    for attr, dist, center in rows:
+        count += 1
+        sum_dist += dist
+        sum_center += center
+        min_attr, max_attr = min(min_attr, attr), max(max_attr, attr)
+        min_dist, max_dist = min(min_dist, dist), max(max_dist, dist)
+        min_center, max_center = min(min_center, center), max(max_center, center)
+    return CentralityStats(count, sum_dist, sum_center, min_attr, max_attr, min_dist, max_dist, min_center, max_center)
+
+
+def SmallTransform(dist, mean):
+    return 1 / (1 + dist / mean)
+
+
+def CentralityIndex(attr, sum_dist, center_dist, stats):
+    # INTERACTION_INDEX for one feature or whole arrays. The small transform decreases with the
+    # distance, so its min and max come from the max and min distance and need no extra pass
+    mean_dist = stats.sum_dist / stats.count
+    mean_center = stats.sum_center / stats.count
+    rescaled_attr = rescale(attr, stats.min_attr, stats.max_attr, 0, 1)
+    rescaled_dist = rescale(SmallTransform(sum_dist, mean_dist), SmallTransform(stats.max_dist, mean_dist),
+                            SmallTransform(stats.min_dist, mean_dist), 0, 1)
+    rescaled_center = rescale(SmallTransform(center_dist, mean_center), SmallTransform(stats.max_center, mean_center),
+                              SmallTransform(stats.min_center, mean_center), 0, 1)
+    return rescaled_attr + ((rescaled_dist + rescaled_center) / 2) / 2